@@ -0,0 +1,38 @@
+from write_behind import WriteBehindBuffer
+
+# === БУФЕР АКТИВНОСТИ (WRITE-BEHIND) ===
+# Обработчики только обновляют словарь в памяти: user_id -> [last_activity, delta].
+# Фоновый поток раз в flush_interval секунд (или при накоплении flush_batch записей)
+# пишет всё накопленное в users.db одной транзакцией.
+
+
+class ActivityBuffer(WriteBehindBuffer):
+    thread_name = "activity-flusher"
+    error_text = "Ошибка сброса активности"
+
+    def __init__(self, store, flush_interval=1.0, flush_batch=500, max_pending=50000):
+        self.store = store
+        super().__init__(flush_interval, flush_batch, max_pending)
+
+    def record(self, user_id, now):
+        self.put((user_id, now, 1))
+
+    def _new_pending(self):
+        return {}
+
+    def _add(self, item):
+        user_id, now, delta = item
+        entry = self.pending.get(user_id)
+        if entry is None:
+            self.pending[user_id] = [now, delta]
+        else:
+            entry[0] = max(entry[0], now)
+            entry[1] += delta
+
+    def _restore(self, batch):
+        # Возвращаем несохранённое в буфер, чтобы не потерять счётчики
+        for uid, (now, delta) in batch.items():
+            self._add((uid, now, delta))
+
+    def _write(self, batch):
+        self.store.touch_users([(uid, entry[0], entry[1]) for uid, entry in batch.items()])
@@ -0,0 +1,136 @@
+import json
+import queue
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+# === ЛОКАЛЬНАЯ ЗАМЕНА TELEGRAM BOT API ===
+# Отвечает на методы, которые вызывает бот, с настраиваемой задержкой и долей
+# ответов 429. Считает вызовы по методам. Подключается через
+# telebot.apihelper.API_URL = server.api_url
+
+
+class FakeTelegram:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, rate_429=0.0, retry_after=1, seed=1):
+        self.latency = latency
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.errors = Counter()
+        self.updates = queue.Queue()
+        self.lock = threading.Lock()
+        self.message_id = 0
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def api_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/bot{{0}}/{{1}}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="fake-telegram", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def reset_counters(self):
+        with self.lock:
+            self.calls.clear()
+            self.errors.clear()
+
+    def push_update(self, update):
+        # Для getUpdates: обновления отдаются по одному пакету на запрос
+        self.updates.put(update)
+
+    # --- ответы ---
+    def _next_message_id(self):
+        with self.lock:
+            self.message_id += 1
+            return self.message_id
+
+    def _message(self, params, photo=None):
+        message = {
+            "message_id": int(params.get("message_id") or self._next_message_id()),
+            "date": int(time.time()),
+            "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+        }
+        if "text" in params:
+            message["text"] = params["text"]
+        if photo:
+            message["photo"] = [{"file_id": f"file-{abs(hash(photo))}", "file_unique_id": f"u-{abs(hash(photo))}",
+                                 "width": 1280, "height": 853}]
+        return message
+
+    def respond(self, method, params):
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        if method == "getUpdates":
+            batch = []
+            try:
+                batch.append(self.updates.get(timeout=min(float(params.get("timeout", 0) or 0), 1.0)))
+                while len(batch) < 100:
+                    batch.append(self.updates.get_nowait())
+            except queue.Empty:
+                pass
+            return batch
+        if method in ("sendMessage", "editMessageText"):
+            return self._message(params)
+        if method == "sendPhoto":
+            return self._message(params, photo=params.get("photo"))
+        if method == "editMessageMedia":
+            media = json.loads(params.get("media", "{}"))
+            return self._message(params, photo=media.get("media"))
+        if method == "sendDocument":
+            return self._message(params)
+        # answerCallbackQuery, deleteMessage, editMessageReplyMarkup, setWebhook, deleteWebhook, ...
+        return True
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _handle(self):
+                url = urlparse(self.path)
+                method = url.path.rsplit("/", 1)[-1]
+                params = dict(parse_qsl(url.query))
+                length = int(self.headers.get("Content-Length", 0) or 0)
+                body = self.rfile.read(length) if length else b""
+                if body and self.headers.get("Content-Type", "").startswith("application/x-www-form-urlencoded"):
+                    params.update(parse_qsl(body.decode("utf-8")))
+                with server.lock:
+                    server.calls[method] += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                if method not in ("getUpdates", "getMe") and server.random.random() < server.rate_429:
+                    with server.lock:
+                        server.errors[method] += 1
+                    payload = {"ok": False, "error_code": 429,
+                               "description": f"Too Many Requests: retry after {server.retry_after}",
+                               "parameters": {"retry_after": server.retry_after}}
+                    return self._reply(429, payload)
+                self._reply(200, {"ok": True, "result": server.respond(method, params)})
+
+            do_GET = _handle
+            do_POST = _handle
+
+            def _reply(self, code, payload):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,284 @@
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from telebot import apihelper, types
+from bench.fake_telegram import FakeTelegram
+from broadcast import DELIVERED, BLOCKED, FAILED
+from lanes import ShardedExecutor
+
+# === НАГРУЗОЧНЫЙ ПРОГОН БОТА БЕЗ СЕТИ ===
+# Поднимает FakeTelegram, направляет на него telebot и прогоняет через обработчики
+# bot.py синтетические потоки обновлений. Результат — JSON с пропускной способностью,
+# p50/p99 задержки обработчика, числом вызовов API и SQL-запросов на обновление.
+#
+#   python -m bench.run --users 200 --latency-ms 20 --out bench_results.json
+#   python -m bench.run --scenarios broadcast --users 1000 --rate-429 0.01 --fake-redis
+#
+# БД создаётся во временной папке. Состояния FSM и сессии хранятся в Redis: нужен
+# REDIS_URL или флаг --fake-redis (пакет fakeredis).
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADMIN_ID = 1
+SCENARIOS = ("browse", "swipe", "order", "broadcast")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон обработчиков bot.py")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--lanes", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="задержка ответа фейкового API")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--broadcast-rate", type=float, default=1000.0, help="лимит рассылки, сообщений/с")
+    parser.add_argument("--outbound-rate", type=float, default=1000.0,
+                        help="общий лимит вызовов API, в секунду (в бою 30)")
+    parser.add_argument("--fake-redis", action="store_true")
+    parser.add_argument("--out", default="bench_results.json")
+    return parser.parse_args(argv)
+
+
+# --- синтетические обновления ---
+class UpdateFactory:
+    def __init__(self):
+        self.update_id = 0
+        self.message_id = 1000000
+
+    def _ids(self):
+        self.update_id += 1
+        self.message_id += 1
+        return self.update_id, self.message_id
+
+    def text(self, user_id, text):
+        update_id, message_id = self._ids()
+        return {"update_id": update_id, "message": {
+            "message_id": message_id, "date": int(time.time()), "text": text,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"},
+        }}
+
+    def callback(self, user_id, data):
+        update_id, message_id = self._ids()
+        return {"update_id": update_id, "callback_query": {
+            "id": str(update_id), "chat_instance": str(user_id), "data": data,
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"},
+            "message": {"message_id": message_id, "date": int(time.time()),
+                        "chat": {"id": user_id, "type": "private"}},
+        }}
+
+
+def user_stream(scenario, factory, user_id, catalog):
+    bikes = list(catalog.bikes)
+    bike = bikes[user_id % len(bikes)]
+    if scenario == "browse":
+        return [factory.text(user_id, "/start"), factory.text(user_id, "Каталог"),
+                factory.callback(user_id, bike), factory.callback(user_id, f"specs_{bike}")]
+    if scenario == "swipe":
+        count = catalog.photo_count(bikes[0])
+        forward = [factory.callback(user_id, f"next_photo_{bikes[0]}_{i}") for i in range(1, count)]
+        back = [factory.callback(user_id, f"prev_photo_{bikes[0]}_{i}") for i in range(count - 2, -1, -1)]
+        return [factory.callback(user_id, bikes[0])] + forward + back
+    if scenario == "order":
+        size = next(iter(catalog.frame_sizes))
+        return [factory.callback(user_id, f"order_{bike}"), factory.callback(user_id, f"size_{size}"),
+                factory.text(user_id, f"Иван +7 900 {user_id:07d}")]
+    raise ValueError(scenario)
+
+
+def interleave(streams):
+    # Пользователи "нажимают" одновременно: по одному обновлению от каждого по кругу
+    result = []
+    for i in range(max(len(s) for s in streams)):
+        result.extend(s[i] for s in streams if i < len(s))
+    return result
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p * (len(values) - 1))))]
+
+
+class Bench:
+    def __init__(self, args):
+        self.args = args
+        self.sql = Counter()
+        self.sql_lock = threading.Lock()
+
+    def setup(self):
+        self.workdir = tempfile.mkdtemp(prefix="bot-bench-")
+        os.chdir(self.workdir)
+        os.environ.update({
+            "BOT_TOKEN": "123456:bench",
+            "ADMIN_ID": str(ADMIN_ID),
+            "BROADCAST_RATE": str(self.args.broadcast_rate),
+            "OUTBOUND_RATE": str(self.args.outbound_rate),
+            "CATALOG_FILE": os.path.join(REPO_ROOT, "catalog.json"),
+        })
+        os.environ.setdefault("REDIS_URL", "redis://localhost:6379/15")
+
+        self.api = FakeTelegram(latency=self.args.latency_ms / 1000, rate_429=self.args.rate_429).start()
+        apihelper.API_URL = self.api.api_url
+
+        import bot as app
+        self.app = app
+        if self.args.fake_redis:
+            import fakeredis
+            redis = fakeredis.FakeRedis()
+            app.storage.redis = redis
+            app.sessions.redis = redis
+        app.bot.threaded = False
+        app.user_store.conn.set_trace_callback(self._count_sql)
+        app.activity_buffer.start()
+        app.orders.start()
+        app.events.start()
+
+    def _count_sql(self, statement):
+        with self.sql_lock:
+            self.sql["total"] += 1
+
+    def reset(self):
+        self.api.reset_counters()
+        with self.sql_lock:
+            self.sql.clear()
+
+    def run_updates(self, updates):
+        latencies = []
+        errors = Counter()
+        lock = threading.Lock()
+
+        def handle(update):
+            started = time.perf_counter()
+            try:
+                self.app.process_update(update)
+            except Exception as e:
+                with lock:
+                    errors[type(e).__name__] += 1
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+
+        executor = ShardedExecutor(handle, lanes=self.args.lanes, queue_size=len(updates) + 1,
+                                   priority_ids=[ADMIN_ID])
+        parsed = [types.Update.de_json(u) for u in updates]
+        executor.start()
+        started = time.perf_counter()
+        for update in parsed:
+            executor.submit(update)
+        executor.stop(timeout=600)
+        self.app.activity_buffer.flush()
+        self.app.events.flush()
+        wall = time.perf_counter() - started
+        return wall, latencies, errors
+
+    def report(self, count, wall, latencies=None, errors=None, extra=None):
+        calls = dict(self.api.calls)
+        total_calls = sum(calls.values())
+        result = {
+            "updates": count,
+            "wall_s": round(wall, 4),
+            "throughput_per_s": round(count / wall, 2) if wall else None,
+            "api_calls": total_calls,
+            "api_calls_per_update": round(total_calls / count, 3) if count else None,
+            "api_calls_by_method": calls,
+            "api_429": dict(self.api.errors),
+            "sql_queries": self.sql["total"],
+            "sql_per_update": round(self.sql["total"] / count, 3) if count else None,
+        }
+        if latencies is not None:
+            result["latency_ms"] = {
+                "p50": round(percentile(latencies, 0.50) * 1000, 3),
+                "p99": round(percentile(latencies, 0.99) * 1000, 3),
+                "max": round(max(latencies) * 1000, 3) if latencies else 0.0,
+            }
+        if errors:
+            result["errors"] = dict(errors)
+        if extra:
+            result.update(extra)
+        return result
+
+    def scenario(self, name):
+        factory = UpdateFactory()
+        catalog = self.app.bike_catalog.current
+        first_user = 1000
+        streams = [user_stream(name, factory, first_user + i, catalog) for i in range(self.args.users)]
+        updates = interleave(streams)
+        self.reset()
+        wall, latencies, errors = self.run_updates(updates)
+        return self.report(len(updates), wall, latencies, errors)
+
+    def broadcast(self):
+        app = self.app
+        now = datetime.datetime.now().isoformat()
+        app.user_store.touch_users([(100000 + i, now, 1) for i in range(self.args.users)])
+        factory = UpdateFactory()
+        app.bot.set_state(ADMIN_ID, app.AdminForm.waiting_for_broadcast_message, ADMIN_ID)
+        app.bot.add_data(ADMIN_ID, ADMIN_ID, broadcast_message="Бенчмарк рассылки")
+        self.reset()
+        started = time.perf_counter()
+        wall, latencies, errors = self.run_updates([factory.callback(ADMIN_ID, "confirm_broadcast")])
+        while app.broadcasts.running:
+            time.sleep(0.05)
+        total_wall = time.perf_counter() - started
+        job_id = app.user_store.execute("SELECT MAX(job_id) FROM broadcast_jobs")[0][0]
+        counts = app.broadcasts.counts(job_id)
+        recipients = app.user_store.count_users()
+        return self.report(recipients, total_wall, latencies, errors, extra={
+            "recipients": recipients,
+            "delivered": counts[DELIVERED],
+            "blocked": counts[BLOCKED],
+            "failed": counts[FAILED],
+            "handler_ms": round(wall * 1000, 3),
+        })
+
+    def run(self):
+        results = {}
+        for name in self.args.scenarios.split(","):
+            name = name.strip()
+            print(f"Сценарий {name}...")
+            results[name] = self.broadcast() if name == "broadcast" else self.scenario(name)
+            print(json.dumps(results[name], ensure_ascii=False))
+        return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    out = os.path.abspath(args.out)
+    # После chdir во временную папку bot.py должен импортироваться из корня репозитория
+    sys.path.insert(0, REPO_ROOT)
+    bench = Bench(args)
+    bench.setup()
+    try:
+        results = bench.run()
+    finally:
+        bench.app.activity_buffer.stop()
+        bench.app.orders.stop()
+        bench.app.events.stop()
+        bench.api.stop()
+    report = {
+        "timestamp": datetime.datetime.now().isoformat(),
+        "revision": git_revision(),
+        "config": vars(args),
+        "results": results,
+    }
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты: {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,11 +2,30 @@ import os
 import logging
 import datetime
 import time
-import sqlite3
-from telebot import TeleBot, types
+import atexit
+import signal
+import sys
+import threading
+import html
+from telebot import TeleBot, types, apihelper
 from telebot.handler_backends import State, StatesGroup
 from telebot.storage import StateRedisStorage
+from telebot.apihelper import ApiTelegramException
 from urllib.parse import urlparse
+from user_store import UserStore
+from activity_buffer import ActivityBuffer
+from broadcast import BroadcastEngine
+from media_cache import MediaCache
+from session_store import SessionStore
+from router import Router
+from catalog import Catalog
+from webhook import WebhookServer
+from lanes import ShardedExecutor
+from metrics import REGISTRY, MetricsServer, SamplingProfiler, instrument_telegram, instrument_redis, timed_handler
+from outbound import OutboundScheduler, install_session, send_priority, NOTIFY, BULK
+from orders import OrderBook, format_order, KIND_ORDER, KIND_CALLBACK, DONE, CONTACTS_PREVIEW
+from events import EventLog, CATALOG_OPEN, BIKE_VIEW, PHOTO_NAV, SPECS_VIEW, ORDER, FUNNEL_STEPS
+from export import export_users, FORMATS
 
 # === ЛОГИРОВАНИЕ ===
 logging.basicConfig(level=logging.INFO)
@@ -54,227 +73,331 @@ except Exception as e:
 # === БАЗА ДАННЫХ ===
 DB_FILE = "users.db"
 
-def ensure_users_db():
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            user_id TEXT PRIMARY KEY,
-            username TEXT,
-            first_name TEXT,
-            last_name TEXT,
-            full_name TEXT,
-            first_seen TEXT,
-            last_activity TEXT,
-            messages_count INTEGER
-        )
-    ''')
-    conn.commit()
-    conn.close()
-    print(f"БД {DB_FILE} готова")
-
-ensure_users_db()
+try:
+    user_store = UserStore(DB_FILE)
+    print(f"БД {DB_FILE} готова (WAL)")
+except Exception as e:
+    print(f"Ошибка открытия БД: {e}")
+    exit(1)
+
+# Активность копится в памяти и пишется пачками в фоне
+activity_buffer = ActivityBuffer(
+    user_store,
+    flush_interval=int(os.getenv("ACTIVITY_FLUSH_MS", "1000")) / 1000,
+    flush_batch=int(os.getenv("ACTIVITY_FLUSH_BATCH", "500")),
+    max_pending=int(os.getenv("ACTIVITY_BUFFER_MAX", "50000"))
+)
+
+# Рассылки: задания и статусы получателей в той же БД
+broadcasts = BroadcastEngine(
+    user_store,
+    bot,
+    workers=int(os.getenv("BROADCAST_WORKERS", "4")),
+    rate=float(os.getenv("BROADCAST_RATE", "25"))
+)
+
+# Заявки: сначала в БД, админу — сводками (ORDER_DIGEST_SECONDS=0 — каждая сразу отдельным сообщением)
+orders = OrderBook(
+    user_store,
+    bot,
+    ADMIN_ID,
+    digest_window=float(os.getenv("ORDER_DIGEST_SECONDS", "10"))
+)
+
+# События каталога для воронки: пишутся пачками в фоне
+events = EventLog(
+    user_store,
+    flush_interval=int(os.getenv("EVENTS_FLUSH_MS", "2000")) / 1000,
+    flush_batch=int(os.getenv("EVENTS_FLUSH_BATCH", "1000"))
+)
+
+# === МЕТРИКИ ===
+# METRICS_PORT — порт с /metrics в формате Prometheus (0 — выключить).
+# WEBHOOK_METRICS=1 — отдавать /metrics и состояние полос ещё и на публичном порту webhook
+# (только для платформ с одним портом: адрес доступен из интернета без секрета).
+# PROFILE_SAMPLE_MS — включает сэмплирующий профилировщик (стеки на /debug/profile и в PROFILE_OUT).
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9090"))
+WEBHOOK_METRICS = os.getenv("WEBHOOK_METRICS") == "1"
+PROFILE_SAMPLE_MS = float(os.getenv("PROFILE_SAMPLE_MS", "0"))
+
+instrument_telegram(apihelper)
+instrument_redis(storage.redis)
+
+def broadcast_recipients():
+    for job_id, total, counts in broadcasts.progress_snapshot():
+        for status, value in counts.items():
+            yield (job_id, status), value
+
+REGISTRY.gauge("bot_broadcast_recipients", "Получатели идущих рассылок по статусам",
+               ("job", "status"), collect=broadcast_recipients)
+REGISTRY.gauge("bot_broadcast_total", "Всего получателей в идущих рассылках", ("job",),
+               collect=lambda: [((job_id,), total) for job_id, total, _ in broadcasts.progress_snapshot()])
+REGISTRY.gauge("bot_activity_buffer_pending", "Пользователи с несброшенной активностью",
+               collect=lambda: [((), len(activity_buffer.pending))])
+
+# === ИСХОДЯЩИЕ ВЫЗОВЫ ===
+# Все вызовы Bot API идут через одну keep-alive сессию и общий планировщик с лимитами
+# и приоритетами (ставится поверх замеров метрик — в метрики попадает каждая попытка)
+install_session(apihelper, pool_size=int(os.getenv("OUTBOUND_POOL_SIZE", "32")))
+outbound = OutboundScheduler(
+    rate=float(os.getenv("OUTBOUND_RATE", "30")),
+    chat_burst=int(os.getenv("OUTBOUND_CHAT_BURST", "3")),
+    max_retries=int(os.getenv("OUTBOUND_RETRIES", "3"))
+)
+outbound.install(apihelper)
+
+REGISTRY.gauge("bot_outbound_waiting", "Вызовы Bot API в очереди планировщика",
+               collect=lambda: [((), outbound.gate.waiting())])
 
 # === ПОЛЬЗОВАТЕЛИ ===
-def load_users():
+def add_user(user_id, username, first_name, last_name):
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM users")
-        rows = cursor.fetchall()
-        users = {}
-        for row in rows:
-            users[row[0]] = {
-                'username': row[1], 'first_name': row[2], 'last_name': row[3],
-                'full_name': row[4], 'first_seen': row[5], 'last_activity': row[6],
-                'messages_count': row[7]
-            }
-        conn.close()
-        return users
+        user_store.upsert_user(user_id, username, first_name, last_name, datetime.datetime.now().isoformat())
     except Exception as e:
-        print(f"Ошибка загрузки: {e}")
-        return {}
+        print(f"Ошибка сохранения: {e}")
 
-def save_users(users):
+def submit_order(kind, msg, **fields):
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        for uid, data in users.items():
-            cursor.execute('''
-                INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                uid, data.get('username'), data.get('first_name'), data.get('last_name'),
-                data.get('full_name'), data.get('first_seen'), data.get('last_activity'),
-                data.get('messages_count')
-            ))
-        conn.commit()
-        conn.close()
-        return True
+        return orders.add(kind, msg.from_user.id, username=msg.from_user.username,
+                          first_name=msg.from_user.first_name, **fields)
     except Exception as e:
-        print(f"Ошибка сохранения: {e}")
-        return False
-
-def add_user(user_id, username, first_name, last_name):
-    users = load_users()
-    now = datetime.datetime.now().isoformat()
-    uid = str(user_id)
-    if uid in users:
-        users[uid].update({
-            'username': username, 'first_name': first_name, 'last_name': last_name,
-            'full_name': f"{first_name} {last_name or ''}".strip(),
-            'last_activity': now,
-            'messages_count': users[uid].get('messages_count', 0) + 1
-        })
-    else:
-        users[uid] = {
-            'username': username, 'first_name': first_name, 'last_name': last_name,
-            'full_name': f"{first_name} {last_name or ''}".strip(),
-            'first_seen': now, 'last_activity': now, 'messages_count': 1
-        }
-    save_users(users)
-
-def get_all_users():
-    return load_users()
+        print(f"Ошибка сохранения заявки: {e}")
+        # БД недоступна — отправляем админу напрямую, чтобы заявка не пропала
+        order = {"order_id": "?", "kind": kind, "user_id": msg.from_user.id,
+                 "username": msg.from_user.username, "first_name": msg.from_user.first_name,
+                 "bike": None, "frame_size": None, "contacts": None, **fields}
+        with send_priority(NOTIFY):
+            bot.send_message(ADMIN_ID, format_order(order))
 
 def update_user_activity(user_id):
-    users = load_users()
-    uid = str(user_id)
-    if uid in users:
-        users[uid]['last_activity'] = datetime.datetime.now().isoformat()
-        users[uid]['messages_count'] = users[uid].get('messages_count', 0) + 1
-        save_users(users)
-    else:
-        add_user(user_id, None, None, None)
+    activity_buffer.record(str(user_id), datetime.datetime.now().isoformat())
+
+def count_users():
+    # Сначала сбрасываем буфер, чтобы админка видела свежие данные
+    activity_buffer.flush()
+    return user_store.count_users()
 
 # === FSM ===
 class AdminForm(StatesGroup):
     waiting_for_broadcast_message = State()
 
 # === КАТАЛОГ ===
-bikes = {
-    "PRIMO": {
-        "description": "<b>PRIMO</b>\n\nМаневренная, универсальная модель для активного фанового катания в холмистой местности.\n\nБазовый уровень линейки — для зрелых любителей качества и современных тенденций велостроения.\n\nРозничная цена 50 000 руб.",
-        "photos": [
-            "https://optim.tildacdn.com/tild6336-3032-4434-b935-346363326131/-/format/webp/Photo-70.webp",
-            "https://optim.tildacdn.com/tild6536-6564-4661-b563-323737643733/-/format/webp/Photo-45.webp",
-            "https://optim.tildacdn.com/tild6263-6233-4537-a436-633033386132/-/format/webp/Photo-47.webp",
-            "https://optim.tildacdn.com/tild3731-3531-4463-b933-386135363632/-/format/webp/Photo-48.webp",
-            "https://optim.tildacdn.com/tild3038-3263-4935-a533-326637363030/-/format/webp/Photo-49.webp",
-            "https://optim.tildacdn.com/tild3831-3637-4836-b836-363934653638/-/format/webp/Photo-50.webp",
-            "https://optim.tildacdn.com/tild6665-3839-4632-a663-613133313564/-/format/webp/Photo-55.webp",
-            "https://optim.tildacdn.com/tild3734-6433-4835-b639-623036366165/-/format/webp/Photo-57.webp"
-        ],
-        "specs": {
-            "Вилка": "UDING DS HLO", "Передний переключатель": "SHIMANO ALTUS M315", "Задний переключатель": "SHIMANO ALTUS M310",
-            "Шифтеры": "SHIMANO ALTUS M315 2x8s", "Тормоза": "SHIMANO MT 200", "Кассета": "SHIMANO CS-HG-41-8 11-34T",
-            "Цепь": "TEC C8 16S", "Система": "PROWHEEL CY-10TM", "Картридж": "GINEYEA BB73 68mm", "Ротор": "SHIMANO RT-26S 160мм",
-            "Втулки": "SOLON 901F/R AL", "Обода": "HENGTONG HLQC-GA10", "Покрышки": "KENDA K1162",
-            "Руль": "ZOOM MTB AL 31,8 720/760мм", "Вынос": "ZOOM TDS-C301", "Грипсы": "VELO VLG-609",
-            "Рулевая колонка": "GINEYEA GH-830", "Седло": "VELO VL-3534", "Подседельный штырь": "ZOOM SP-C212",
-            "Педали": "FENGDE NW-430"
-        }
-    },
-    "TERZO": {
-        "description": "<b>TERZO</b>\n\nНа треть эффективнее аналогов в этой нише.\nОтличное решение для тех, кто перерос прогулочный байк и готов для большего.\n\nРозничная цена 65 000 руб.",
-        "photos": ["https://optim.tildacdn.com/tild3531-3036-4463-b536-303235326633/-/format/webp/Photo-71.webp"],
-        "specs": {
-            "Вилка": "UDING DS HLO", "Передний переключатель": "-", "Задний переключатель": "SHIMANO CUES 9S",
-            "Шифтеры": "SHIMANO CUES 9S", "Тормоза": "SHIMANO MT 200", "Кассета": "SHIMANO CUES 11-41T 9S",
-            "Цепь": "SHIMANO LG500", "Система": "PROWHEEL C10YNW-32T", "Картридж": "GINEYEA BB73 68mm",
-            "Ротор": "SHIMANO RT-26M 180мм", "Втулки": "SOLON 901F/R AL", "Обода": "HENGTONG HLGC-GA10",
-            "Покрышки": "KENDA K1162", "Руль": "ZOOM MTB AL 31,8 740/760мм", "Вынос": "ZOOM TDS-RD301",
-            "Грипсы": "VELO VLG-609", "Рулевая колонка": "GINEYEA GH-830", "Седло": "VELO VL-3534",
-            "Подседельный штырь": "ZOOM SP-C212", "Педали": "FENGDE NW-430"
-        }
-    },
-    "ULTIMO": {
-        "description": "<b>ULTIMO</b>\n\nТоповый в линейке middle-сегмента трейловых велосипедов для прогрессирующих райдеров.\nПредназначен для гонок и катания на пересечённой местности со средним или существенным перепадом высот.\n\nРозничная цена 75 000 руб.",
-        "photos": ["https://optim.tildacdn.com/tild3637-6439-4237-b638-303336613863/-/format/webp/Photo-69.webp"],
-        "specs": {
-            "Вилка": "UDING DS HLO", "Передний переключатель": "-", "Задний переключатель": "SHIMANO CUES 10S",
-            "Шифтеры": "SHIMANO CUES 10S", "Тормоза": "SHIMANO MT 200", "Кассета": "SHIMANO CUES CS-LG400 11-48T 10S",
-            "Цепь": "SHIMANO LG500", "Система": "PROWHEEL RMZ 32T", "Картридж": "PROWHEEL PW-MBB73 HOLOWTECH 2",
-            "Ротор": "SHIMANO RT-26M 180мм", "Втулки": "SOLON 901F/R AL", "Обода": "HENGTONG HLGC-GA10",
-            "Покрышки": "OBOR W3104", "Руль": "ZOOM MTB AL 31,8 740/760мм", "Вынос": "ZOOM TDS-C301",
-            "Грипсы": "VELO VLG-609", "Рулевая колонка": "GINEYEA GH-830", "Седло": "VELO VL-3534",
-            "Подседельный штырь": "ZOOM SP-C212", "Педали": "FENGDE NW-430"
-        }
-    },
-    "TESORO": {
-        "description": "<b>TESORO</b>\n\nСбалансированный аппарат для катания в горах и холмистой местности, для техничных трасс с прыжками и виражами.\n\nРозничная цена 85 000 руб.",
-        "photos": ["https://optim.tildacdn.com/tild3932-3166-4537-b837-386365666162/-/format/webp/Photo-72.webp"],
-        "specs": {
-            "Вилка": "ZOOM 868 AIR BOOST", "Передний переключатель": "-", "Задний переключатель": "SHIMANO CUES 115",
-            "Шифтеры": "SHIMANO CUES 115", "Тормоза": "SHIMANO MT 200", "Кассета": "SHIMANO CUES CS-LG400 11-50T 11S",
-            "Цепь": "SHIMANO LG500", "Система": "PROWHEEL RMZ 32T", "Картридж": "PROWHEEL PW-MB73 HOLOWITECH 2",
-            "Ротор": "SHIMANO RT-26M 180мм", "Втулки": "SOLON 9081F/TR AL", "Обода": "ПИСТОНИРОВАННЫЙ STAR 32H",
-            "Покрышки": "OBOR W3104", "Руль": "ZOOM MTB AL 31,8 740/760мм", "Вынос": "ZOOM TDS-RD307A",
-            "Грипсы": "VELO VLG-609", "Рулевая колонка": "GINEYEA GH-830", "Седло": "VELO VLG-609",
-            "Подседельный штырь": "ZOOM SP218", "Педали": "FENGDE NW-430"
-        }
-    },
-    "OTTIMO": {
-        "description": "<b>OTTIMO</b>\n\nНа этом байке реально проехать кросс-кантрийный марафон, уверенно проходить сложные участки и крутые спуски.\nПозволяет чувствовать себя на равных с мировыми брендами в соревнованиях.\n\nРозничная цена 95 000 руб.",
-        "photos": ["https://optim.tildacdn.com/tild3662-3335-4362-a665-303137396364/-/format/webp/Photo-73.webp"],
-        "specs": {
-            "Вилка": "ROCK SHOX FS RECON 29F", "Передний переключатель": "-", "Задний переключатель": "SHIMANO CUES 11S",
-            "Шифтеры": "SHIMANO CUES 11S", "Тормоза": "SHIMANO MT 200", "Кассета": "SHIMANO CUES CS-LG400 11-50T 11S",
-            "Цепь": "SHIMANO LG500", "Система": "SHIMANO CUES FC-U6000-1", "Картридж": "SHIMANO BB-M501 HOLOWTECH 2",
-            "Ротор": "SHIMANO RT-26M 180мм", "Втулки": "SOLON 908TF/TR AL", "Обода": "ПИСТОНИРОВАННЫЙ STAR 32H",
-            "Покрышки": "MAXXIS RECON M355", "Руль": "ZOOM MTB AL 31,8 740/760мм", "Вынос": "ZOOM TDS-D479",
-            "Грипсы": "VELO VLG-1266-11D2", "Рулевая колонка": "GINEYEA GH-202", "Седло": "VELO 1C58",
-            "Подседельный штырь": "ZOOM SP218"
-        }
-    }
-}
-
-frame_sizes = {"M (17\")": "163-177 см", "L (19\")": "173-187 см", "XL (21\")": "182-197 см"}
-user_photo_index = {}
-user_selections = {}
+# Данные в catalog.json; правки подхватываются без перезапуска
+CATALOG_FILE = os.getenv("CATALOG_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalog.json"))
+
+try:
+    bike_catalog = Catalog(CATALOG_FILE, poll_interval=float(os.getenv("CATALOG_POLL_SECONDS", "5")))
+    print(f"Каталог загружен: {len(bike_catalog.current.bikes)} моделей")
+except Exception as e:
+    print(f"Ошибка загрузки каталога: {e}")
+    exit(1)
+
+# Выбор модели/размера при заказе: Redis с TTL, общий для всех процессов бота
+sessions = SessionStore(
+    storage.redis,
+    prefix="order_session",
+    ttl=int(os.getenv("SESSION_TTL", "86400")),
+    max_entries=int(os.getenv("SESSION_MAX_LOCAL", "10000"))
+)
+
+# file_id загруженных фото: повторные показы не качают webp с CDN
+media_cache = MediaCache(user_store)
+
+def prewarm_photos(chat_id=ADMIN_ID):
+    with send_priority(BULK):
+        uploaded = media_cache.prewarm(bot, chat_id, bike_catalog.current.photo_urls)
+    print(f"Прогрев фото: загружено {uploaded}, в кэше {len(media_cache.file_ids)}")
+    return uploaded
+
+# === МАРШРУТЫ ===
+text_routes = Router(normalize=lambda text: text.strip().lower())
+callback_routes = Router()
+
+def is_admin(update):
+    return update.from_user.id == ADMIN_ID
 
 # === АДМИНКА ===
 @bot.message_handler(commands=['admin'])
+@timed_handler
 def admin_panel(msg):
     if msg.from_user.id != ADMIN_ID:
         bot.send_message(msg.chat.id, "Нет доступа")
         return
     kb = types.ReplyKeyboardMarkup(resize_keyboard=True)
-    kb.add("Статистика", "Рассылка", "Список пользователей", "Выйти из админки")
-    bot.send_message(msg.chat.id, f"<b>Админ-панель</b>\nПользователей: {len(get_all_users())}", parse_mode="HTML", reply_markup=kb)
+    kb.add("Статистика", "Рассылка", "Список пользователей", "Заявки", "Воронка", "Экспорт", "Выйти из админки")
+    bot.send_message(msg.chat.id, f"<b>Админ-панель</b>\nПользователей: {count_users()}", parse_mode="HTML", reply_markup=kb)
 
-@bot.message_handler(func=lambda m: m.text and m.text == "Статистика" and m.from_user.id == ADMIN_ID)
+@text_routes.on_exact("Статистика", guard=is_admin)
 def show_stats(msg):
-    users = get_all_users()
-    today = datetime.datetime.now().date()
-    active_today = sum(1 for u in users.values() if u.get('last_activity') and datetime.datetime.fromisoformat(u['last_activity']).date() == today)
-    total_messages = sum(u.get('messages_count', 0) for u in users.values())
-    bot.send_message(msg.chat.id, f"<b>Статистика</b>\nВсего: {len(users)}\nСегодня: {active_today}\nСообщений: {total_messages}", parse_mode="HTML")
+    activity_buffer.flush()
+    stats = user_store.stats(datetime.datetime.now().date().isoformat())
+    bot.send_message(msg.chat.id, f"<b>Статистика</b>\nВсего: {stats['total']}\nСегодня: {stats['active_today']}\nСообщений: {stats['messages']}", parse_mode="HTML")
+
+@bot.message_handler(commands=['rebuild_stats'], func=lambda m: m.from_user.id == ADMIN_ID)
+@timed_handler
+def rebuild_stats(msg):
+    activity_buffer.flush()
+    drift = user_store.rebuild_stats()
+    text = "<b>Пересчёт статистики</b>\n\n"
+    for name, (old, new) in drift.items():
+        text += f"{name}: {old} → {new}{' (расхождение)' if old != new else ''}\n"
+    bot.send_message(msg.chat.id, text, parse_mode="HTML")
 
-@bot.message_handler(func=lambda m: m.text and m.text == "Список пользователей" and m.from_user.id == ADMIN_ID)
-def show_users_list(msg):
-    users = get_all_users()
+USERS_PAGE_SIZE = 10
+
+def render_users_page(page, after=None, before=None):
+    users, more = user_store.users_page(USERS_PAGE_SIZE, after=after, before=before)
     if not users:
-        bot.send_message(msg.chat.id, "Пользователей нет")
-        return
-    sorted_users = sorted(users.items(), key=lambda x: x[1]['last_activity'], reverse=True)
+        return None, None
+    has_prev = page > 0
+    has_next = more if before is None else True
     text = "<b>Последние пользователи:</b>\n\n"
-    for i, (uid, data) in enumerate(sorted_users[:10], 1):
-        text += f"{i}. {data['full_name']}\n"
-        text += f"   @{data['username'] or 'нет'}\n"
-        text += f"   ID: {uid}\n"
+    for i, data in enumerate(users, page * USERS_PAGE_SIZE + 1):
+        text += f"{i}. {html.escape(str(data['full_name']))}\n"
+        text += f"   @{html.escape(data['username'] or 'нет')}\n"
+        text += f"   ID: {data['user_id']}\n"
         text += f"   Сообщений: {data['messages_count']}\n\n"
+    # Курсор (last_activity|user_id) крайней строки едет в callback_data
+    row = []
+    if has_prev:
+        first = users[0]
+        row.append(types.InlineKeyboardButton("Пред", callback_data=f"users_prev_{page - 1}_{first['last_activity']}|{first['user_id']}"))
+    if has_next:
+        last = users[-1]
+        row.append(types.InlineKeyboardButton("След", callback_data=f"users_next_{page + 1}_{last['last_activity']}|{last['user_id']}"))
+    kb = types.InlineKeyboardMarkup()
+    if row:
+        kb.row(*row)
+    return text, kb
+
+@text_routes.on_exact("Список пользователей", guard=is_admin)
+def show_users_list(msg):
+    activity_buffer.flush()
+    text, kb = render_users_page(0)
+    if not text:
+        bot.send_message(msg.chat.id, "Пользователей нет")
+        return
+    bot.send_message(msg.chat.id, text, parse_mode="HTML", reply_markup=kb)
+
+@callback_routes.on_prefix("users_prev_", "users_next_", guard=is_admin)
+def navigate_users_list(call):
+    direction, page, cursor = call.data[len("users_"):].split("_", 2)
+    last_activity, user_id = cursor.rsplit("|", 1)
+    page = int(page)
+    if direction == "next":
+        text, kb = render_users_page(page, after=(last_activity, user_id))
+    elif page == 0:
+        # На первую страницу возвращаемся без курсора — там всегда самые свежие
+        text, kb = render_users_page(0)
+    else:
+        text, kb = render_users_page(page, before=(last_activity, user_id))
+    bot.answer_callback_query(call.id)
+    if not text:
+        return
+    bot.edit_message_text(text, call.message.chat.id, call.message.message_id, parse_mode="HTML", reply_markup=kb)
+
+FUNNEL_LABELS = {BIKE_VIEW: "просмотр", PHOTO_NAV: "фото", SPECS_VIEW: "спецификация", ORDER: "заказ"}
+
+@text_routes.on_exact("Воронка", guard=is_admin)
+def show_funnel(msg):
+    events.flush()
+    funnel = events.funnel()
+    total, users = funnel.get("", {}).get(CATALOG_OPEN, (0, 0))
+    text = f"<b>Воронка (уникальные пользователи)</b>\nОткрыли каталог: {users} ({total} раз)\n\n"
+    # Сначала модели из текущего каталога, затем снятые с продажи, по которым есть история
+    bikes = list(bike_catalog.current.bikes) + sorted(b for b in funnel if b and b not in bike_catalog.current.bikes)
+    for bike in bikes:
+        steps = funnel.get(bike, {})
+        views = steps.get(BIKE_VIEW, (0, 0))[1]
+        parts = []
+        for step in FUNNEL_STEPS:
+            count = steps.get(step, (0, 0))[1]
+            share = f" ({count * 100 // views}%)" if views and step != BIKE_VIEW else ""
+            parts.append(f"{FUNNEL_LABELS[step]} {count}{share}")
+        text += f"<b>{html.escape(bike)}</b>\n" + " → ".join(parts) + "\n\n"
     bot.send_message(msg.chat.id, text, parse_mode="HTML")
 
-@bot.message_handler(func=lambda m: m.text and m.text == "Рассылка" and m.from_user.id == ADMIN_ID)
+def send_users_export(chat_id, fmt):
+    activity_buffer.flush()
+    f, count = export_users(user_store, fmt)
+    with f:
+        bot.send_document(chat_id, f, visible_file_name=f"users_{datetime.date.today().isoformat()}.{fmt}",
+                          caption=f"Пользователей: {count}")
+
+@text_routes.on_exact("Экспорт", guard=is_admin)
+def export_button(msg):
+    send_users_export(msg.chat.id, "csv")
+
+@bot.message_handler(commands=['export'], func=lambda m: m.from_user.id == ADMIN_ID)
+@timed_handler
+def export_command(msg):
+    # /export или /export json
+    args = msg.text.split()[1:]
+    fmt = args[0].lower() if args else "csv"
+    if fmt not in FORMATS:
+        bot.send_message(msg.chat.id, f"Формат: {', '.join(FORMATS)}")
+        return
+    send_users_export(msg.chat.id, fmt)
+
+ORDERS_PAGE_SIZE = 5
+
+def render_orders_page(page, after=None, before=None):
+    rows, more = orders.open_page(ORDERS_PAGE_SIZE, after=after, before=before)
+    if not rows:
+        return None, None
+    has_next = more if before is None else True
+    text = f"<b>Открытые заявки: {orders.open_count()}</b>\n\n"
+    text += "\n\n".join(f"{html.escape(format_order(o, CONTACTS_PREVIEW))}\n<i>{o['created_at'][:16]}</i>" for o in rows)
+    kb = types.InlineKeyboardMarkup()
+    for o in rows:
+        kb.add(types.InlineKeyboardButton(f"Закрыть #{o['order_id']}", callback_data=f"orders_close_{o['order_id']}"))
+    row = []
+    if page > 0:
+        row.append(types.InlineKeyboardButton("Пред", callback_data=f"orders_prev_{page - 1}_{rows[0]['order_id']}"))
+    if has_next:
+        row.append(types.InlineKeyboardButton("След", callback_data=f"orders_next_{page + 1}_{rows[-1]['order_id']}"))
+    if row:
+        kb.row(*row)
+    return text, kb
+
+@text_routes.on_exact("Заявки", guard=is_admin)
+def show_orders(msg):
+    text, kb = render_orders_page(0)
+    if not text:
+        bot.send_message(msg.chat.id, "Открытых заявок нет")
+        return
+    bot.send_message(msg.chat.id, text, parse_mode="HTML", reply_markup=kb)
+
+@callback_routes.on_prefix("orders_prev_", "orders_next_", "orders_close_", guard=is_admin)
+def navigate_orders(call):
+    action, rest = call.data[len("orders_"):].split("_", 1)
+    if action == "close":
+        orders.set_status(int(rest), DONE)
+        bot.answer_callback_query(call.id, f"Заявка #{rest} закрыта")
+        text, kb = render_orders_page(0)
+    else:
+        page, cursor = rest.split("_", 1)
+        page, cursor = int(page), int(cursor)
+        bot.answer_callback_query(call.id)
+        if action == "next":
+            text, kb = render_orders_page(page, after=cursor)
+        elif page == 0:
+            text, kb = render_orders_page(0)
+        else:
+            text, kb = render_orders_page(page, before=cursor)
+    if not text:
+        text, kb = "Открытых заявок нет", None
+    bot.edit_message_text(text, call.message.chat.id, call.message.message_id, parse_mode="HTML", reply_markup=kb)
+
+@text_routes.on_exact("Рассылка", guard=is_admin)
 def start_broadcast(msg):
-    total = len(get_all_users())
+    total = count_users()
     if total == 0:
         bot.send_message(msg.chat.id, "Нет пользователей")
         return
     bot.send_message(msg.chat.id, f"<b>Рассылка</b>\nПолучателей: {total}\n\nНапишите сообщение:", parse_mode="HTML")
     bot.set_state(msg.from_user.id, AdminForm.waiting_for_broadcast_message, msg.chat.id)
 
-@bot.message_handler(state=AdminForm.waiting_for_broadcast_message, content_types=['text'])
 def process_broadcast_message(msg):
     kb = types.InlineKeyboardMarkup()
     kb.add(types.InlineKeyboardButton("Разослать", callback_data="confirm_broadcast"))
@@ -282,35 +405,35 @@ def process_broadcast_message(msg):
     with bot.retrieve_data(msg.from_user.id, msg.chat.id) as data:
         data['broadcast_message'] = msg.text
     preview = msg.text[:100] + "..." if len(msg.text) > 100 else msg.text
-    bot.send_message(msg.chat.id, f"<b>Подтверждение</b>\n\n{preview}\n\nПолучателей: {len(get_all_users())}", parse_mode="HTML", reply_markup=kb)
+    bot.send_message(msg.chat.id, f"<b>Подтверждение</b>\n\n{preview}\n\nПолучателей: {count_users()}", parse_mode="HTML", reply_markup=kb)
 
-@bot.callback_query_handler(func=lambda call: call.data == "confirm_broadcast")
+@callback_routes.on_exact("confirm_broadcast", guard=is_admin)
 def confirm_broadcast(call):
     with bot.retrieve_data(call.from_user.id, call.message.chat.id) as data:
         text = data.get('broadcast_message', '')
     if not text:
         bot.answer_callback_query(call.id, "Ошибка")
         return
-    users = get_all_users()
-    success = 0
+    activity_buffer.flush()
+    bot.answer_callback_query(call.id)
     bot.edit_message_text("Рассылка начата...", call.message.chat.id, call.message.message_id)
-    for i, uid in enumerate(users.keys()):
-        try:
-            bot.send_message(int(uid), text)
-            success += 1
-            if (i + 1) % 10 == 0:
-                time.sleep(1)
-        except:
-            pass
-    bot.edit_message_text(f"<b>Готово</b>\nУспешно: {success}\nВсего: {len(users)}", call.message.chat.id, call.message.message_id, parse_mode="HTML")
+    job_id = broadcasts.create_job(text, call.message.chat.id, call.message.message_id)
+    broadcasts.start(job_id)
     bot.delete_state(call.from_user.id, call.message.chat.id)
 
-@bot.callback_query_handler(func=lambda call: call.data == "cancel_broadcast")
+@callback_routes.on_exact("cancel_broadcast", guard=is_admin)
 def cancel_broadcast(call):
     bot.delete_state(call.from_user.id, call.message.chat.id)
     bot.edit_message_text("Отменено", call.message.chat.id, call.message.message_id)
 
-@bot.message_handler(func=lambda m: m.text and m.text == "Выйти из админки" and m.from_user.id == ADMIN_ID)
+@bot.message_handler(commands=['prewarm'], func=lambda m: m.from_user.id == ADMIN_ID)
+@timed_handler
+def prewarm_command(msg):
+    bot.send_message(msg.chat.id, "Загружаю фото каталога...")
+    uploaded = prewarm_photos(msg.chat.id)
+    bot.send_message(msg.chat.id, f"Готово. Загружено: {uploaded}, в кэше: {len(media_cache.file_ids)}")
+
+@text_routes.on_exact("Выйти из админки", guard=is_admin)
 def exit_admin(msg):
     kb = types.ReplyKeyboardMarkup(resize_keyboard=True)
     kb.add("Каталог", "Позвать специалиста", "О нас")
@@ -318,125 +441,276 @@ def exit_admin(msg):
 
 # === ОСНОВНОЕ ===
 @bot.message_handler(commands=['start'])
+@timed_handler
 def start(msg):
     add_user(msg.from_user.id, msg.from_user.username, msg.from_user.first_name, msg.from_user.last_name)
     kb = types.ReplyKeyboardMarkup(resize_keyboard=True)
     kb.add("Каталог", "Позвать специалиста", "О нас")
     bot.send_message(msg.chat.id, "Привет! Выберите действие:", reply_markup=kb)
 
-@bot.message_handler(func=lambda m: "специалиста" in m.text.lower())
+@text_routes.on_exact("Позвать специалиста")
 def call_specialist(msg):
     update_user_activity(msg.from_user.id)
+    submit_order(KIND_CALLBACK, msg)
     bot.send_message(msg.chat.id, "Специалист свяжется с вами!")
-    bot.send_message(ADMIN_ID, f"Запрос от @{msg.from_user.username or 'нет'} ({msg.from_user.id})")
 
-@bot.message_handler(func=lambda m: "Каталог" in m.text)
+@text_routes.on_exact("Каталог")
 def catalog(msg):
     update_user_activity(msg.from_user.id)
-    kb = types.InlineKeyboardMarkup()
-    for bike in bikes:
-        kb.add(types.InlineKeyboardButton(bike, callback_data=bike))
-    bot.send_message(msg.chat.id, "Выберите модель:", reply_markup=kb)
+    events.record(CATALOG_OPEN, msg.from_user.id)
+    bot.send_message(msg.chat.id, "Выберите модель:", reply_markup=bike_catalog.current.keyboard)
 
-@bot.callback_query_handler(func=lambda call: call.data in bikes)
 def show_bike(call):
     update_user_activity(call.from_user.id)
-    name = call.data
-    user_photo_index[call.from_user.id] = {'bike': name, 'index': 0}
-    show_photo(call.message, call.from_user.id, name, 0)
+    cat = bike_catalog.current
+    if call.data in cat.bikes:
+        events.record(BIKE_VIEW, call.from_user.id, call.data)
+        show_photo(call.message, cat, call.data, 0)
     bot.answer_callback_query(call.id)
 
-def show_photo(message, user_id, bike_name, idx):
-    bike = bikes[bike_name]
-    photos = bike["photos"]
-    kb = types.InlineKeyboardMarkup()
-    if len(photos) > 1:
-        row = []
-        if idx > 0:
-            row.append(types.InlineKeyboardButton("Пред", callback_data=f"prev_photo_{bike_name}"))
-        row.append(types.InlineKeyboardButton(f"{idx+1}/{len(photos)}", callback_data="ignore"))
-        if idx < len(photos) - 1:
-            row.append(types.InlineKeyboardButton("След", callback_data=f"next_photo_{bike_name}"))
-        kb.row(*row)
-    kb.add(types.InlineKeyboardButton("Спецификация", callback_data=f"specs_{bike_name}"))
-    kb.add(types.InlineKeyboardButton("Заказать", callback_data=f"order_{bike_name}"))
-    kb.add(types.InlineKeyboardButton("Назад", callback_data="back_to_catalog"))
-    caption = bike["description"] if idx == 0 else f"Фото {idx+1}"
-    bot.send_photo(message.chat.id, photos[idx], caption=caption, reply_markup=kb, parse_mode="HTML")
+def show_photo(message, cat, bike_name, idx):
+    media_cache.send_photo(bot, message.chat.id, cat.photo(bike_name, idx), caption=cat.captions[(bike_name, idx)],
+                           reply_markup=cat.photo_keyboards[(bike_name, idx)], parse_mode="HTML")
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith(("prev_photo_", "next_photo_")))
+@callback_routes.on_prefix("prev_photo_", "next_photo_")
 def navigate_photo(call):
     update_user_activity(call.from_user.id)
-    uid = call.from_user.id
-    if uid not in user_photo_index:
+    # Модель и номер фото приходят в callback_data — состояние на сервере не нужно
+    cat = bike_catalog.current
+    bike, _, idx = call.data.split("_photo_", 1)[1].rpartition("_")
+    if bike not in cat.bikes or not idx.isdigit():
+        bot.answer_callback_query(call.id)
         return
-    data = user_photo_index[uid]
-    bike = data['bike']
-    idx = data['index']
-    if call.data.startswith("prev"):
-        idx = max(0, idx - 1)
-    else:
-        idx = min(len(bikes[bike]["photos"]) - 1, idx + 1)
-    user_photo_index[uid]['index'] = idx
+    idx = max(0, min(cat.photo_count(bike) - 1, int(idx)))
+    events.record(PHOTO_NAV, call.from_user.id, bike)
     try:
-        bot.delete_message(call.message.chat.id, call.message.message_id)
-    except:
-        pass
-    show_photo(call.message, uid, bike, idx)
+        # Меняем фото прямо в сообщении — один запрос к API
+        media_cache.edit_photo(bot, call.message.chat.id, call.message.message_id, cat.photo(bike, idx),
+                               caption=cat.captions[(bike, idx)], parse_mode="HTML", reply_markup=cat.photo_keyboards[(bike, idx)])
+    except ApiTelegramException as e:
+        if "message is not modified" not in (e.description or ""):
+            # Сообщение уже нельзя редактировать (удалено, слишком старое) — шлём новое
+            print(f"Не удалось отредактировать фото: {e.description}")
+            show_photo(call.message, cat, bike, idx)
+    # Пока запрос не отвечен, на кнопке крутятся часики
+    bot.answer_callback_query(call.id)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("specs_"))
+@callback_routes.on_prefix("specs_")
 def show_specs(call):
     update_user_activity(call.from_user.id)
-    name = call.data.replace("specs_", "")
-    specs = bikes[name]["specs"]
-    text = f"<b>Спецификация {name}</b>\n\n"
-    for k, v in specs.items():
-        text += f"• <b>{k}:</b> {v}\n"
-    kb = types.InlineKeyboardMarkup()
-    kb.add(types.InlineKeyboardButton("Назад", callback_data=name))
-    bot.send_message(call.message.chat.id, text, parse_mode="HTML", reply_markup=kb)
+    cat = bike_catalog.current
+    name = call.data[len("specs_"):]
+    if name not in cat.spec_texts:
+        bot.answer_callback_query(call.id)
+        return
+    events.record(SPECS_VIEW, call.from_user.id, name)
+    bot.send_message(call.message.chat.id, cat.spec_texts[name], parse_mode="HTML", reply_markup=cat.back_keyboards[name])
+    bot.answer_callback_query(call.id)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("order_"))
+@callback_routes.on_prefix("order_")
 def select_size(call):
     update_user_activity(call.from_user.id)
-    name = call.data.replace("order_", "")
-    user_selections[call.from_user.id] = {"bike": name}
-    kb = types.InlineKeyboardMarkup()
-    for size, h in frame_sizes.items():
-        kb.add(types.InlineKeyboardButton(f"{size} ({h})", callback_data=f"size_{size}"))
-    kb.add(types.InlineKeyboardButton("Назад", callback_data=name))
-    bot.send_message(call.message.chat.id, f"Выбрано: {name}\n\nВыберите размер:", reply_markup=kb)
+    cat = bike_catalog.current
+    name = call.data[len("order_"):]
+    if name not in cat.size_keyboards:
+        bot.answer_callback_query(call.id)
+        return
+    sessions.set(call.from_user.id, {"bike": name})
+    bot.send_message(call.message.chat.id, cat.size_prompts[name], reply_markup=cat.size_keyboards[name])
+    bot.answer_callback_query(call.id)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("size_"))
+@callback_routes.on_prefix("size_")
 def save_size(call):
     update_user_activity(call.from_user.id)
-    size = call.data.replace("size_", "")
+    frame_sizes = bike_catalog.current.frame_sizes
+    size = call.data[len("size_"):]
     uid = call.from_user.id
-    user_selections[uid]["frame_size"] = size
-    user_selections[uid]["height_range"] = frame_sizes[size]
-    bot.send_message(call.message.chat.id, f"Отлично!\nМодель: {user_selections[uid]['bike']}\nРазмер: {size}\n\nНапишите имя и телефон:")
+    sel = sessions.get(uid)
+    if not sel.get("bike") or size not in frame_sizes:
+        # Сессия истекла — просим выбрать модель заново
+        bot.send_message(call.message.chat.id, "Выбор устарел, выберите модель в каталоге ещё раз.")
+        bot.answer_callback_query(call.id)
+        return
+    sel = sessions.update(uid, frame_size=size, height_range=frame_sizes[size])
+    bot.send_message(call.message.chat.id, f"Отлично!\nМодель: {sel['bike']}\nРазмер: {size}\n\nНапишите имя и телефон:")
+    bot.answer_callback_query(call.id)
 
-@bot.message_handler(func=lambda m: any(c.isdigit() for c in m.text) and len(m.text) > 5)
 def save_order(msg):
     update_user_activity(msg.from_user.id)
     uid = msg.from_user.id
-    sel = user_selections.get(uid, {})
-    admin_msg = f"Новая заявка:\n\nПользователь: {msg.from_user.first_name}\nID: {uid}\nМодель: {sel.get('bike')}\nРазмер: {sel.get('frame_size')}\nКонтакты: {msg.text}"
-    bot.send_message(ADMIN_ID, admin_msg)
+    sel = sessions.get(uid)
+    submit_order(KIND_ORDER, msg, bike=sel.get('bike'), frame_size=sel.get('frame_size'), contacts=msg.text)
+    events.record(ORDER, uid, sel.get('bike'))
     bot.send_message(msg.chat.id, "Спасибо! Мы свяжемся с вами.")
-    if uid in user_selections:
-        del user_selections[uid]
+    if sel:
+        sessions.delete(uid)
 
-@bot.message_handler(func=lambda m: True)
 def track(msg):
     update_user_activity(msg.from_user.id)
 
-# === ЗАПУСК В РЕЖИМЕ POLLING ===
-if __name__ == "__main__":
+def looks_like_contacts(text):
+    return len(text) > 5 and any(c.isdigit() for c in text)
+
+def in_broadcast_state(msg):
+    # Состояние в Redis проверяем только для админа, а не на каждое сообщение
+    state = bot.get_state(msg.from_user.id, msg.chat.id)
+    return state == AdminForm.waiting_for_broadcast_message.name
+
+def not_broadcasting(msg):
+    return not (is_admin(msg) and in_broadcast_state(msg))
+
+# Набранные вручную фразы — как в исходной версии: "специалиста" в любом регистре,
+# "Каталог" только с заглавной, иначе контакты вида "модель из каталога, 8900..." не станут заявкой
+text_routes.on_contains("специалиста", ignore_case=True, guard=not_broadcasting)(call_specialist)
+text_routes.on_contains("Каталог", guard=not_broadcasting)(catalog)
+
+@text_routes.on_fallback
+def route_free_text(msg):
+    if is_admin(msg) and in_broadcast_state(msg):
+        process_broadcast_message(msg)
+    elif looks_like_contacts(msg.text):
+        save_order(msg)
+    else:
+        track(msg)
+
+@callback_routes.on_fallback
+def route_unknown_callback(call):
+    # "ignore" (счётчик фото) и устаревшие кнопки — просто гасим часики
+    bot.answer_callback_query(call.id)
+
+# Модели каталога приходят как callback_data без префикса; при перезагрузке
+# каталога таблица маршрутов и кэш фото обновляются вместе с ним
+@bike_catalog.on_reload
+def apply_catalog(cat):
+    callback_routes.set_exact(cat.bikes, show_bike)
+    media_cache.prune(cat.photo_urls)
+
+apply_catalog(bike_catalog.current)
+
+# Единственные обработчики telebot для текста и callback-ов; регистрируются
+# после команд, поэтому /start, /admin и т.д. обрабатываются раньше
+@bot.message_handler(content_types=['text'])
+def route_message(msg):
+    text_routes.dispatch(msg, msg.text)
+
+@bot.callback_query_handler(func=lambda call: True)
+def route_callback(call):
+    callback_routes.dispatch(call, call.data)
+
+# === ЗАВЕРШЕНИЕ ===
+profiler = None
+
+def shutdown():
+    activity_buffer.stop()
+    print("Буфер активности сброшен")
+    orders.stop()
+    events.stop()
+    if profiler is not None:
+        profiler.stop()
+
+def handle_sigterm(signum, frame):
+    print("Получен SIGTERM, останавливаемся...")
+    sys.exit(0)
+
+# === ЗАПУСК ===
+# BOT_MODE=polling (по умолчанию) или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+
+def process_update(update):
+    # last_update_id двигает только поток приёма (submit_updates), поэтому полосы
+    # вызывают обработчики напрямую по типу обновления. Других типов бот не обрабатывает.
+    if update.message:
+        bot.process_new_messages([update.message])
+    elif update.callback_query:
+        bot.process_new_callback_query([update.callback_query])
+    elif update.edited_message:
+        bot.process_new_edited_messages([update.edited_message])
+
+# Обновления раскладываются по полосам по from_user.id: разные пользователи
+# параллельно, один пользователь — по порядку; админ в отдельной полосе
+update_lanes = ShardedExecutor(
+    process_update,
+    lanes=int(os.getenv("UPDATE_LANES", "4")),
+    queue_size=int(os.getenv("UPDATE_LANE_QUEUE", "1000")),
+    priority_ids=[ADMIN_ID]
+)
+
+REGISTRY.gauge("bot_update_lane_depth", "Обновления в очереди полосы", ("lane",),
+               collect=lambda: [((s["lane"],), s["depth"]) for s in update_lanes.stats()])
+REGISTRY.gauge("bot_update_lane_saturation", "Доля времени, которую полоса занята", ("lane",),
+               collect=lambda: [((s["lane"],), s["saturation"]) for s in update_lanes.stats()])
+
+def submit_updates(updates):
+    for update in updates:
+        update_lanes.submit(update)
+        if update.update_id > bot.last_update_id:
+            bot.last_update_id = update.update_id
+
+def run_polling():
     print("Бот запущен в режиме polling (без webhook)")
     try:
-        bot.infinity_polling()
+        # Если раньше работали через webhook, getUpdates вернёт 409 — снимаем его
+        bot.remove_webhook()
     except Exception as e:
-        print(f"Ошибка polling: {e}")
-        time.sleep(5)
+        print(f"Не удалось снять webhook: {e}")
+    while True:
+        try:
+            bot.infinity_polling()
+            return
+        except Exception as e:
+            print(f"Ошибка polling: {e}, перезапуск через 5 с")
+            time.sleep(5)
+
+def run_webhook():
+    webhook_url = os.getenv("WEBHOOK_URL")
+    if webhook_url and not os.getenv("WEBHOOK_SECRET"):
+        # Без секрета публичный адрес принимает любой POST как обновление от Telegram
+        print("ОШИБКА: WEBHOOK_URL задан без WEBHOOK_SECRET — webhook не регистрируем")
+        exit(1)
+    server = WebhookServer(
+        update_lanes,
+        port=int(os.getenv("PORT", "8080")),
+        path=os.getenv("WEBHOOK_PATH", "/webhook"),
+        secret=os.getenv("WEBHOOK_SECRET"),
+        metrics=REGISTRY if WEBHOOK_METRICS else None
+    )
+    if webhook_url:
+        bot.set_webhook(url=webhook_url.rstrip("/") + server.path, secret_token=os.getenv("WEBHOOK_SECRET"))
+        print(f"Webhook зарегистрирован: {webhook_url}")
+    else:
+        print("WEBHOOK_URL не задан — webhook в Telegram не регистрируем (локальный режим)")
+    try:
+        server.serve_forever()
+    finally:
+        server.close()
 
+if __name__ == "__main__":
+    activity_buffer.start()
+    orders.start()
+    events.start()
+    broadcasts.resume_unfinished()
+    bike_catalog.watch()
+    if os.getenv("PREWARM_PHOTOS") == "1":
+        threading.Thread(target=prewarm_photos, name="photo-prewarm", daemon=True).start()
+    if PROFILE_SAMPLE_MS > 0:
+        profiler = SamplingProfiler(PROFILE_SAMPLE_MS / 1000, out_path=os.getenv("PROFILE_OUT", "profile.txt")).start()
+    if METRICS_PORT:
+        try:
+            MetricsServer(REGISTRY, port=METRICS_PORT, profiler=profiler).start()
+        except Exception as e:
+            print(f"Ошибка запуска сервера метрик: {e}")
+    atexit.register(shutdown)
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    # Обработчики выполняют полосы, а не внутренний пул telebot: polling и webhook
+    # только передают им обновления (при полной полосе polling ждёт — это backpressure)
+    bot.threaded = False
+    bot.process_new_updates = submit_updates
+    update_lanes.start()
+    try:
+        if BOT_MODE == "webhook":
+            run_webhook()
+        else:
+            run_polling()
+    finally:
+        left = update_lanes.stop()
+        print(f"Очереди обновлений разобраны, осталось: {left}")
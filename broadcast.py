@@ -0,0 +1,243 @@
+import datetime
+import queue
+import threading
+import time
+from telebot.apihelper import ApiTelegramException
+from rate_limit import TokenBucket, GLOBAL_RATE
+from outbound import send_priority, BULK, NOTIFY
+
+# === РАССЫЛКИ ===
+# Задание и статус каждого получателя лежат в users.db, поэтому прерванная рассылка
+# продолжается с того же места без повторной отправки. Отправкой занимается
+# небольшой пул потоков под своим token bucket (доля общего лимита); 429 останавливает
+# весь пул на retry_after. Отправки идут с приоритетом BULK — ответы пользователям
+# в общем планировщике (outbound.py) обгоняют рассылку.
+
+BROADCAST_SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS broadcast_jobs (
+        job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        text TEXT NOT NULL,
+        admin_chat_id INTEGER NOT NULL,
+        status_message_id INTEGER,
+        status TEXT NOT NULL DEFAULT 'running',
+        total INTEGER NOT NULL DEFAULT 0,
+        created_at TEXT NOT NULL,
+        finished_at TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS broadcast_recipients (
+        job_id INTEGER NOT NULL,
+        user_id TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        error TEXT,
+        PRIMARY KEY (job_id, user_id)
+    ) WITHOUT ROWID
+    ''',
+    "CREATE INDEX IF NOT EXISTS broadcast_recipients_status ON broadcast_recipients (job_id, status, user_id)",
+)
+
+PENDING = "pending"
+DELIVERED = "delivered"
+BLOCKED = "blocked"
+FAILED = "failed"
+
+FEED_CHUNK = 500
+
+
+class BroadcastEngine:
+    def __init__(self, store, bot, workers=4, rate=GLOBAL_RATE, progress_interval=3.0, max_retries=5):
+        self.store = store
+        self.bot = bot
+        self.workers = workers
+        self.progress_interval = progress_interval
+        self.max_retries = max_retries
+        self.bucket = TokenBucket(rate)
+        self.running = {}
+        # job_id -> (счётчики по статусам, всего, блокировка счётчиков) для метрик
+        self.progress = {}
+        self.lock = threading.Lock()
+        with store.transaction("CREATE_SCHEMA") as conn:
+            for sql in BROADCAST_SCHEMA:
+                conn.execute(sql)
+
+    # --- задания ---
+    def create_job(self, text, admin_chat_id, status_message_id):
+        now = datetime.datetime.now().isoformat()
+        with self.store.transaction("CREATE_BROADCAST") as conn:
+            job_id = conn.execute(
+                "INSERT INTO broadcast_jobs (text, admin_chat_id, status_message_id, created_at) VALUES (?, ?, ?, ?)",
+                (text, admin_chat_id, status_message_id, now)
+            ).lastrowid
+            total = conn.execute(
+                "INSERT INTO broadcast_recipients (job_id, user_id) SELECT ?, user_id FROM users",
+                (job_id,)
+            ).rowcount
+            conn.execute("UPDATE broadcast_jobs SET total = ? WHERE job_id = ?", (total, job_id))
+        return job_id
+
+    def start(self, job_id):
+        with self.lock:
+            if job_id in self.running:
+                return False
+            thread = threading.Thread(target=self._run_job, args=(job_id,), name=f"broadcast-{job_id}", daemon=True)
+            self.running[job_id] = thread
+        thread.start()
+        return True
+
+    def resume_unfinished(self):
+        rows = self.store.execute("SELECT job_id FROM broadcast_jobs WHERE status = 'running'")
+        for (job_id,) in rows:
+            print(f"Продолжаем рассылку #{job_id}")
+            self.start(job_id)
+        return len(rows)
+
+    def counts(self, job_id):
+        rows = self.store.execute(
+            "SELECT status, COUNT(*) FROM broadcast_recipients WHERE job_id = ? GROUP BY status", (job_id,)
+        )
+        counts = {PENDING: 0, DELIVERED: 0, BLOCKED: 0, FAILED: 0}
+        counts.update(dict(rows))
+        return counts
+
+    def progress_snapshot(self):
+        # [(job_id, всего, {статус: количество})] по идущим рассылкам
+        with self.lock:
+            items = list(self.progress.items())
+        result = []
+        for job_id, (counts, total, counts_lock) in items:
+            with counts_lock:
+                result.append((job_id, total, dict(counts)))
+        return result
+
+    # --- выполнение ---
+    def _run_job(self, job_id):
+        try:
+            text, admin_chat_id, status_message_id, total = self.store.execute(
+                "SELECT text, admin_chat_id, status_message_id, total FROM broadcast_jobs WHERE job_id = ?", (job_id,)
+            )[0]
+            counts = self.counts(job_id)
+            counts_lock = threading.Lock()
+            tasks = queue.Queue(maxsize=self.workers * 50)
+            finished = threading.Event()
+            alive = [self.workers]
+            with self.lock:
+                self.progress[job_id] = (counts, total, counts_lock)
+
+            def worker():
+                try:
+                    while True:
+                        user_id = tasks.get()
+                        if user_id is None:
+                            return
+                        status, error = self._deliver(int(user_id), text)
+                        try:
+                            self.store.write(
+                                "UPDATE broadcast_recipients SET status = ?, error = ? WHERE job_id = ? AND user_id = ?",
+                                (status, error, job_id, user_id)
+                            )
+                        except Exception as e:
+                            print(f"Ошибка сохранения статуса рассылки: {e}")
+                        with counts_lock:
+                            counts[PENDING] -= 1
+                            counts[status] += 1
+                finally:
+                    with counts_lock:
+                        alive[0] -= 1
+                        if not alive[0]:
+                            finished.set()
+
+            for i in range(self.workers):
+                threading.Thread(target=worker, name=f"broadcast-{job_id}-w{i}", daemon=True).start()
+            threading.Thread(target=self._feed, args=(job_id, tasks), daemon=True).start()
+
+            shown = None
+            while not finished.wait(self.progress_interval):
+                with counts_lock:
+                    snapshot = dict(counts)
+                if snapshot != shown:
+                    self._edit_status(admin_chat_id, status_message_id, self.progress_text(snapshot, total))
+                    shown = snapshot
+
+            final = self.counts(job_id)
+            if final[PENDING]:
+                # Кто-то остался не обработан — задание продолжится при следующем запуске
+                print(f"Рассылка #{job_id} прервана, осталось {final[PENDING]}")
+                return
+            self.store.write(
+                "UPDATE broadcast_jobs SET status = 'done', finished_at = ? WHERE job_id = ?",
+                (datetime.datetime.now().isoformat(), job_id)
+            )
+            self._edit_status(admin_chat_id, status_message_id, self.final_text(final, total))
+        except Exception as e:
+            print(f"Ошибка рассылки #{job_id}: {e}")
+        finally:
+            with self.lock:
+                self.running.pop(job_id, None)
+                self.progress.pop(job_id, None)
+
+    def _feed(self, job_id, tasks):
+        # Keyset по индексу (job_id, status, user_id): в памяти не больше одной пачки id
+        last = ""
+        try:
+            while True:
+                rows = self.store.execute(
+                    "SELECT user_id FROM broadcast_recipients WHERE job_id = ? AND status = ? AND user_id > ? "
+                    "ORDER BY user_id LIMIT ?",
+                    (job_id, PENDING, last, FEED_CHUNK)
+                )
+                for (user_id,) in rows:
+                    tasks.put(user_id)
+                if len(rows) < FEED_CHUNK:
+                    break
+                last = rows[-1][0]
+        except Exception as e:
+            print(f"Ошибка чтения получателей рассылки #{job_id}: {e}")
+        finally:
+            for _ in range(self.workers):
+                tasks.put(None)
+
+    def _deliver(self, chat_id, text):
+        error = None
+        for attempt in range(self.max_retries):
+            self.bucket.acquire()
+            try:
+                with send_priority(BULK):
+                    self.bot.send_message(chat_id, text)
+                return DELIVERED, None
+            except ApiTelegramException as e:
+                if e.error_code == 429:
+                    retry_after = (e.result_json.get('parameters') or {}).get('retry_after', 1)
+                    self.bucket.pause(retry_after)
+                    error = e.description
+                    continue
+                if e.error_code == 403:
+                    return BLOCKED, e.description
+                return FAILED, e.description
+            except Exception as e:
+                # Сетевые ошибки — повторяем с нарастающей паузой
+                error = str(e)
+                time.sleep(min(2 ** attempt, 30))
+        return FAILED, error
+
+    def _edit_status(self, chat_id, message_id, text):
+        if not message_id:
+            return
+        try:
+            with send_priority(NOTIFY):
+                self.bot.edit_message_text(text, chat_id, message_id, parse_mode="HTML")
+        except Exception as e:
+            # "message is not modified" и подобное не должно останавливать рассылку
+            print(f"Не удалось обновить статус рассылки: {e}")
+
+    @staticmethod
+    def progress_text(counts, total):
+        done = total - counts[PENDING]
+        return (f"<b>Рассылка идёт...</b>\n{done}/{total}\n"
+                f"Доставлено: {counts[DELIVERED]}\nЗаблокировали: {counts[BLOCKED]}\nОшибки: {counts[FAILED]}")
+
+    @staticmethod
+    def final_text(counts, total):
+        return (f"<b>Готово</b>\nДоставлено: {counts[DELIVERED]}\nЗаблокировали бота: {counts[BLOCKED]}\n"
+                f"Ошибки: {counts[FAILED]}\nВсего: {total}")
@@ -0,0 +1,169 @@
+import html
+import json
+import os
+import re
+import threading
+from telebot import types
+
+# === КАТАЛОГ ===
+# Модели и размеры рам читаются из catalog.json. Всё, что показывается
+# пользователю (тексты спецификаций, клавиатуры), собирается один раз при загрузке,
+# поэтому обработчики только достают готовое из словарей.
+# При изменении файла (по mtime) собирается новый снимок и подменяется целиком —
+# обработчик, взявший старый снимок, дорабатывает с ним без смешения версий.
+# Файл правят вручную, поэтому снимок проверяется при сборке: ошибка — исключение,
+# и Catalog.check оставляет в работе предыдущий снимок.
+
+# Лимиты Telegram на callback_data (байт) и подпись к фото (символов после разбора HTML)
+MAX_CALLBACK_DATA = 64
+MAX_CAPTION = 1024
+
+
+def caption_length(text):
+    return len(html.unescape(re.sub(r"<[^>]*>", "", text)))
+
+
+def validate_catalog(data):
+    if not isinstance(data, dict) or not isinstance(data.get("bikes"), dict) or not data["bikes"]:
+        raise ValueError("нет раздела bikes или он пуст")
+    if not isinstance(data.get("frame_sizes"), dict) or not data["frame_sizes"]:
+        raise ValueError("нет раздела frame_sizes или он пуст")
+    callbacks = [f"size_{size}" for size in data["frame_sizes"]]
+    for name, bike in data["bikes"].items():
+        if not isinstance(bike, dict):
+            raise ValueError(f"модель {name!r}: ожидается объект")
+        for key, kind in (("description", str), ("photos", list), ("specs", dict)):
+            if not isinstance(bike.get(key), kind):
+                raise ValueError(f"модель {name!r}: нет поля {key!r} или неверный тип")
+        if not bike["photos"] or not all(isinstance(url, str) and url for url in bike["photos"]):
+            raise ValueError(f"модель {name!r}: список photos пуст или содержит не ссылки")
+        if "_photo_" in name:
+            # По этой подстроке разбирается callback_data листания фото
+            raise ValueError(f"модель {name!r}: имя не должно содержать '_photo_'")
+        if caption_length(bike["description"]) > MAX_CAPTION:
+            # description — подпись к первому фото, длинная ломает показ модели и листание
+            raise ValueError(f"модель {name!r}: description длиннее {MAX_CAPTION} символов — сократите описание")
+        last = len(bike["photos"]) - 1
+        callbacks += [name, f"specs_{name}", f"order_{name}", f"prev_photo_{name}_{last}", f"next_photo_{name}_{last}"]
+    for data_str in callbacks:
+        if len(data_str.encode("utf-8")) > MAX_CALLBACK_DATA:
+            raise ValueError(f"callback_data длиннее {MAX_CALLBACK_DATA} байт: {data_str!r} — сократите название")
+
+
+def build_photo_keyboard(bike_name, idx, count):
+    kb = types.InlineKeyboardMarkup()
+    if count > 1:
+        row = []
+        if idx > 0:
+            row.append(types.InlineKeyboardButton("Пред", callback_data=f"prev_photo_{bike_name}_{idx - 1}"))
+        row.append(types.InlineKeyboardButton(f"{idx+1}/{count}", callback_data="ignore"))
+        if idx < count - 1:
+            row.append(types.InlineKeyboardButton("След", callback_data=f"next_photo_{bike_name}_{idx + 1}"))
+        kb.row(*row)
+    kb.add(types.InlineKeyboardButton("Спецификация", callback_data=f"specs_{bike_name}"))
+    kb.add(types.InlineKeyboardButton("Заказать", callback_data=f"order_{bike_name}"))
+    kb.add(types.InlineKeyboardButton("Назад", callback_data="back_to_catalog"))
+    return kb
+
+
+class CatalogSnapshot:
+    def __init__(self, data):
+        validate_catalog(data)
+        self.bikes = data["bikes"]
+        self.frame_sizes = data["frame_sizes"]
+
+        self.keyboard = types.InlineKeyboardMarkup()
+        for name in self.bikes:
+            self.keyboard.add(types.InlineKeyboardButton(name, callback_data=name))
+
+        self.photo_urls = [url for bike in self.bikes.values() for url in bike["photos"]]
+        self.photo_keyboards = {}
+        self.captions = {}
+        self.spec_texts = {}
+        self.back_keyboards = {}
+        self.size_keyboards = {}
+        self.size_prompts = {}
+        for name, bike in self.bikes.items():
+            photos = bike["photos"]
+            for idx in range(len(photos)):
+                self.photo_keyboards[(name, idx)] = build_photo_keyboard(name, idx, len(photos))
+                self.captions[(name, idx)] = bike["description"] if idx == 0 else f"Фото {idx+1}"
+
+            lines = [f"<b>Спецификация {name}</b>\n\n"]
+            lines += [f"• <b>{k}:</b> {v}\n" for k, v in bike["specs"].items()]
+            self.spec_texts[name] = "".join(lines)
+
+            back = types.InlineKeyboardMarkup()
+            back.add(types.InlineKeyboardButton("Назад", callback_data=name))
+            self.back_keyboards[name] = back
+
+            sizes = types.InlineKeyboardMarkup()
+            for size, h in self.frame_sizes.items():
+                sizes.add(types.InlineKeyboardButton(f"{size} ({h})", callback_data=f"size_{size}"))
+            sizes.add(types.InlineKeyboardButton("Назад", callback_data=name))
+            self.size_keyboards[name] = sizes
+            self.size_prompts[name] = f"Выбрано: {name}\n\nВыберите размер:"
+
+    def photo(self, bike_name, idx):
+        return self.bikes[bike_name]["photos"][idx]
+
+    def photo_count(self, bike_name):
+        return len(self.bikes[bike_name]["photos"])
+
+
+class Catalog:
+    def __init__(self, path, poll_interval=5.0):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.mtime = None
+        self.current = None
+        self.listeners = []
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.reload()
+
+    def on_reload(self, listener):
+        self.listeners.append(listener)
+        return listener
+
+    def reload(self):
+        with self.lock:
+            mtime = os.stat(self.path).st_mtime_ns
+            with open(self.path, encoding="utf-8") as f:
+                snapshot = CatalogSnapshot(json.load(f))
+            # Присваивание ссылки атомарно: обработчики видят либо старый, либо новый снимок целиком
+            self.current = snapshot
+            self.mtime = mtime
+        for listener in self.listeners:
+            try:
+                listener(snapshot)
+            except Exception as e:
+                print(f"Ошибка обработчика перезагрузки каталога: {e}")
+        return snapshot
+
+    def check(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError as e:
+            print(f"Каталог недоступен: {e}")
+            return False
+        if mtime == self.mtime:
+            return False
+        try:
+            self.reload()
+        except Exception as e:
+            # Битый файл не должен ронять бота — работаем со старым снимком до следующего изменения
+            print(f"Ошибка перезагрузки каталога: {e}")
+            self.mtime = mtime
+            return False
+        print(f"Каталог перезагружен: {len(self.current.bikes)} моделей")
+        return True
+
+    def watch(self):
+        thread = threading.Thread(target=self._watch, name="catalog-watcher", daemon=True)
+        thread.start()
+        return thread
+
+    def _watch(self):
+        while not self.stopped.wait(self.poll_interval):
+            self.check()
@@ -0,0 +1,94 @@
+import datetime
+from write_behind import WriteBehindBuffer
+
+# === ЖУРНАЛ СОБЫТИЙ И ВОРОНКА ===
+# Обработчики только добавляют событие в список в памяти, фоновый поток пишет
+# накопленное одной транзакцией (WriteBehindBuffer, как у ActivityBuffer). Таблица events только растёт.
+# Воронка по моделям поддерживается триггерами в той же транзакции: funnel хранит
+# число событий и уникальных пользователей на (модель, шаг), поэтому админка читает
+# пару десятков строк независимо от размера events.
+# funnel_users — пары (модель, шаг, пользователь) для подсчёта уникальных; дубликаты
+# отсекаются через NOT EXISTS, как в счётчиках users.
+
+CATALOG_OPEN = "catalog_open"
+BIKE_VIEW = "bike_view"
+PHOTO_NAV = "photo_nav"
+SPECS_VIEW = "specs_view"
+ORDER = "order"
+
+# Шаги воронки модели по порядку (catalog_open общий — без модели)
+FUNNEL_STEPS = (BIKE_VIEW, PHOTO_NAV, SPECS_VIEW, ORDER)
+
+EVENTS_SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS events (
+        event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ts TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        event TEXT NOT NULL,
+        bike TEXT NOT NULL DEFAULT ''
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS funnel (
+        bike TEXT NOT NULL,
+        event TEXT NOT NULL,
+        total INTEGER NOT NULL DEFAULT 0,
+        users INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (bike, event)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS funnel_users (
+        bike TEXT NOT NULL,
+        event TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        PRIMARY KEY (bike, event, user_id)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS events_funnel AFTER INSERT ON events
+    BEGIN
+        INSERT INTO funnel (bike, event)
+            SELECT NEW.bike, NEW.event
+            WHERE NOT EXISTS (SELECT 1 FROM funnel WHERE bike = NEW.bike AND event = NEW.event);
+        UPDATE funnel SET total = total + 1 WHERE bike = NEW.bike AND event = NEW.event;
+        INSERT INTO funnel_users (bike, event, user_id)
+            SELECT NEW.bike, NEW.event, NEW.user_id
+            WHERE NOT EXISTS (
+                SELECT 1 FROM funnel_users WHERE bike = NEW.bike AND event = NEW.event AND user_id = NEW.user_id
+            );
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS funnel_users_insert AFTER INSERT ON funnel_users
+    BEGIN
+        UPDATE funnel SET users = users + 1 WHERE bike = NEW.bike AND event = NEW.event;
+    END
+    ''',
+)
+
+
+class EventLog(WriteBehindBuffer):
+    thread_name = "event-flusher"
+    error_text = "Ошибка записи событий"
+
+    def __init__(self, store, flush_interval=2.0, flush_batch=1000, max_pending=100000):
+        self.store = store
+        super().__init__(flush_interval, flush_batch, max_pending)
+        with store.transaction("CREATE_SCHEMA") as conn:
+            for sql in EVENTS_SCHEMA:
+                conn.execute(sql)
+
+    def record(self, event, user_id, bike=None):
+        self.put((datetime.datetime.now().isoformat(), str(user_id), event, bike or ""))
+
+    def _write(self, batch):
+        self.store.write_many("INSERT INTO events (ts, user_id, event, bike) VALUES (?, ?, ?, ?)", batch)
+
+    def funnel(self):
+        # {модель: {шаг: (событий, уникальных пользователей)}}
+        result = {}
+        for bike, event, total, users in self.store.execute("SELECT bike, event, total, users FROM funnel"):
+            result.setdefault(bike, {})[event] = (total, users)
+        return result
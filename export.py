@@ -0,0 +1,51 @@
+import csv
+import io
+import json
+import tempfile
+from user_store import USER_COLUMNS
+
+# === ВЫГРУЗКА ПОЛЬЗОВАТЕЛЕЙ ===
+# Строки идут из UserStore.iter_users() прямо во временный файл на диске,
+# поэтому память не зависит от размера таблицы. Файл отдаётся открытым
+# на начале — его можно сразу передать в send_document.
+
+FORMATS = ("csv", "json")
+
+
+def write_csv(users, f):
+    writer = csv.DictWriter(f, fieldnames=USER_COLUMNS)
+    writer.writeheader()
+    count = 0
+    for user in users:
+        writer.writerow(user)
+        count += 1
+    return count
+
+
+def write_json(users, f):
+    # Массив пишется по одному объекту — весь список в памяти не собирается
+    f.write("[")
+    count = 0
+    for user in users:
+        f.write(",\n" if count else "\n")
+        f.write(json.dumps(user, ensure_ascii=False))
+        count += 1
+    f.write("\n]\n")
+    return count
+
+
+def export_users(store, fmt="csv"):
+    # Возвращает (бинарный файл на начале, число строк); файл удаляется при закрытии
+    f = tempfile.TemporaryFile()
+    # BOM нужен Excel, чтобы открыть CSV с кириллицей без выбора кодировки
+    text = io.TextIOWrapper(f, encoding="utf-8-sig" if fmt == "csv" else "utf-8", newline="")
+    try:
+        count = (write_json if fmt == "json" else write_csv)(store.iter_users(), text)
+        text.flush()
+    except Exception:
+        f.close()
+        raise
+    # Отцепляем обёртку, чтобы её сборка мусором не закрыла файл
+    text.detach()
+    f.seek(0)
+    return f, count
@@ -0,0 +1,111 @@
+import queue
+import threading
+import time
+
+# === ПАРАЛЛЕЛЬНАЯ ОБРАБОТКА С СОХРАНЕНИЕМ ПОРЯДКА ===
+# Обновления раскладываются по N однопоточным "полосам" по from_user.id:
+# разные пользователи обрабатываются параллельно, а нажатия одного пользователя
+# (например, size_ и затем order_) — строго по очереди.
+# Обновления от админов идут в отдельную полосу, чтобы долгие админские
+# операции не задерживали покупателей.
+
+UPDATE_KINDS = (
+    "message", "edited_message", "callback_query", "inline_query",
+    "chosen_inline_result", "shipping_query", "pre_checkout_query",
+    "my_chat_member", "chat_member", "chat_join_request"
+)
+
+
+def update_user_id(update):
+    for kind in UPDATE_KINDS:
+        obj = getattr(update, kind, None)
+        if obj is not None and getattr(obj, "from_user", None) is not None:
+            return obj.from_user.id
+    return 0
+
+
+class Lane:
+    def __init__(self, name, queue_size):
+        self.name = name
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = None
+        self.processed = 0
+        self.busy_total = 0.0
+        self.busy_since = None
+
+
+class ShardedExecutor:
+    def __init__(self, handle, lanes=4, queue_size=1000, priority_ids=(), key=update_user_id):
+        self.handle = handle
+        self.key = key
+        self.priority_ids = set(priority_ids)
+        self.lanes = [Lane(f"lane-{i}", queue_size) for i in range(lanes)]
+        self.admin_lane = Lane("admin", queue_size)
+        self.started_at = None
+
+    def all_lanes(self):
+        return self.lanes + [self.admin_lane]
+
+    def lane_for(self, update):
+        user_id = self.key(update)
+        if user_id in self.priority_ids:
+            return self.admin_lane
+        return self.lanes[user_id % len(self.lanes)]
+
+    def submit(self, update, block=True, timeout=None):
+        # False — полоса переполнена (для webhook это сигнал ответить 503)
+        try:
+            self.lane_for(update).queue.put(update, block=block, timeout=timeout)
+            return True
+        except queue.Full:
+            return False
+
+    def start(self):
+        self.started_at = time.monotonic()
+        for lane in self.all_lanes():
+            lane.thread = threading.Thread(target=self._run, args=(lane,), name=f"updates-{lane.name}", daemon=True)
+            lane.thread.start()
+
+    def _run(self, lane):
+        while True:
+            update = lane.queue.get()
+            if update is None:
+                return
+            lane.busy_since = time.monotonic()
+            try:
+                self.handle(update)
+            except Exception as e:
+                print(f"Ошибка обработки обновления в {lane.name}: {e}")
+            finally:
+                lane.busy_total += time.monotonic() - lane.busy_since
+                lane.busy_since = None
+                lane.processed += 1
+
+    def stop(self, timeout=30):
+        # Сигнал остановки встаёт в конец очереди — всё принятое ранее будет обработано
+        for lane in self.all_lanes():
+            lane.queue.put(None)
+        deadline = time.monotonic() + timeout
+        for lane in self.all_lanes():
+            if lane.thread is not None:
+                lane.thread.join(max(0, deadline - time.monotonic()))
+        return self.depth()
+
+    def depth(self):
+        return sum(lane.queue.qsize() for lane in self.all_lanes())
+
+    def stats(self):
+        now = time.monotonic()
+        elapsed = max(now - (self.started_at or now), 1e-9)
+        result = []
+        for lane in self.all_lanes():
+            busy_since = lane.busy_since
+            busy = lane.busy_total + (now - busy_since if busy_since else 0.0)
+            result.append({
+                "lane": lane.name,
+                "depth": lane.queue.qsize(),
+                "processed": lane.processed,
+                "busy": busy_since is not None,
+                "saturation": round(busy / elapsed, 4),
+            })
+        return result
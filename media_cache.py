@@ -0,0 +1,108 @@
+import datetime
+import threading
+from telebot import types
+from telebot.apihelper import ApiTelegramException
+
+# === КЭШ FILE_ID ДЛЯ ФОТО КАТАЛОГА ===
+# После первой успешной отправки Telegram возвращает file_id, по которому фото
+# можно слать повторно без скачивания с CDN. Ключ — URL, так что изменённая
+# ссылка просто не находится в кэше, а записи для ссылок, которых больше нет
+# в каталоге, удаляются через prune().
+
+MEDIA_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS media_cache (
+        url TEXT PRIMARY KEY,
+        file_id TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    )
+'''
+
+
+def file_id_rejected(e):
+    # 400 бывает и по другим причинам (например, сообщение нельзя редактировать) —
+    # кэш сбрасываем только если Telegram ругается именно на файл
+    return e.error_code == 400 and "file" in (e.description or "").lower()
+
+
+class MediaCache:
+    def __init__(self, store):
+        self.store = store
+        self.lock = threading.Lock()
+        store.write(MEDIA_SCHEMA)
+        self.file_ids = dict(store.execute("SELECT url, file_id FROM media_cache"))
+
+    def get(self, url):
+        return self.file_ids.get(url)
+
+    def put(self, url, file_id):
+        with self.lock:
+            if self.file_ids.get(url) == file_id:
+                return
+            self.file_ids[url] = file_id
+        self.store.write(
+            "INSERT OR REPLACE INTO media_cache (url, file_id, updated_at) VALUES (?, ?, ?)",
+            (url, file_id, datetime.datetime.now().isoformat())
+        )
+
+    def forget(self, url):
+        with self.lock:
+            self.file_ids.pop(url, None)
+        self.store.write("DELETE FROM media_cache WHERE url = ?", (url,))
+
+    def prune(self, urls):
+        stale = set(self.file_ids) - set(urls)
+        for url in stale:
+            self.forget(url)
+        return len(stale)
+
+    def send_photo(self, bot, chat_id, url, **kwargs):
+        file_id = self.get(url)
+        if file_id:
+            try:
+                return bot.send_photo(chat_id, file_id, **kwargs)
+            except ApiTelegramException as e:
+                if not file_id_rejected(e):
+                    raise
+                # file_id больше не принимается — шлём по ссылке и кэшируем заново
+                print(f"file_id для {url} устарел: {e.description}")
+                self.forget(url)
+        msg = bot.send_photo(chat_id, url, **kwargs)
+        self.remember(url, msg)
+        return msg
+
+    def edit_photo(self, bot, chat_id, message_id, url, caption=None, parse_mode=None, reply_markup=None):
+        # Замена фото в существующем сообщении: один запрос вместо delete + send
+        file_id = self.get(url)
+        if file_id:
+            try:
+                media = types.InputMediaPhoto(file_id, caption=caption, parse_mode=parse_mode)
+                return bot.edit_message_media(media, chat_id, message_id, reply_markup=reply_markup)
+            except ApiTelegramException as e:
+                if not file_id_rejected(e):
+                    raise
+                print(f"file_id для {url} устарел: {e.description}")
+                self.forget(url)
+        media = types.InputMediaPhoto(url, caption=caption, parse_mode=parse_mode)
+        msg = bot.edit_message_media(media, chat_id, message_id, reply_markup=reply_markup)
+        self.remember(url, msg)
+        return msg
+
+    def remember(self, url, msg):
+        if msg is not None and getattr(msg, 'photo', None):
+            # Самый большой размер идёт последним
+            self.put(url, msg.photo[-1].file_id)
+
+    def prewarm(self, bot, chat_id, urls):
+        # Загружаем в Telegram все ещё не закэшированные фото, служебные сообщения удаляем
+        uploaded = 0
+        for url in urls:
+            if self.get(url):
+                continue
+            try:
+                msg = bot.send_photo(chat_id, url, disable_notification=True)
+                self.remember(url, msg)
+                uploaded += 1
+                bot.delete_message(chat_id, msg.message_id)
+            except Exception as e:
+                print(f"Не удалось прогреть {url}: {e}")
+        return uploaded
@@ -0,0 +1,352 @@
+import collections
+import functools
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from telebot.apihelper import ApiTelegramException
+
+# === МЕТРИКИ ===
+# Счётчики, гистограммы и гауджи в памяти процесса, отдаются в текстовом формате
+# Prometheus. Запись — словарь по кортежу меток под одной блокировкой на метрику,
+# поэтому замеры на горячем пути почти бесплатны.
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, value=1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def samples(self):
+        with self.lock:
+            items = list(self.values.items())
+        for key, value in items:
+            yield f"{self.name}{_labels(self.label_names, key)} {_number(value)}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        # метки -> [счётчики по корзинам, сумма, количество]
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self.lock:
+            items = [(key, list(entry[0]), entry[1], entry[2]) for key, entry in self.values.items()]
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                yield f"{self.name}_bucket{_labels(self.label_names, key, ('le', _number(bound)))} {cumulative}"
+            yield f"{self.name}_bucket{_labels(self.label_names, key, ('le', '+Inf'))} {count}"
+            yield f"{self.name}_sum{_labels(self.label_names, key)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.label_names, key)} {count}"
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=(), collect=None):
+        # collect() -> [(значения меток, значение)] вызывается при каждом опросе
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.collect = collect
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def set(self, value, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        with self.lock:
+            self.values[key] = value
+
+    def samples(self):
+        if self.collect is not None:
+            items = [(tuple(str(v) for v in key), value) for key, value in self.collect()]
+        else:
+            with self.lock:
+                items = list(self.values.items())
+        for key, value in items:
+            yield f"{self.name}{_labels(self.label_names, key)} {_number(value)}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.lock = threading.Lock()
+
+    def _add(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, labels=(), collect=None):
+        return self._add(Gauge(name, help, labels, collect))
+
+    def render(self):
+        lines = []
+        with self.lock:
+            metrics = list(self.metrics)
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                lines.extend(metric.samples())
+            except Exception as e:
+                print(f"Ошибка сбора метрики {metric.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HANDLER_SECONDS = REGISTRY.histogram(
+    "bot_handler_seconds", "Время работы обработчика обновления", ("handler",))
+HANDLER_ERRORS = REGISTRY.counter(
+    "bot_handler_errors_total", "Исключения в обработчиках", ("handler",))
+TELEGRAM_SECONDS = REGISTRY.histogram(
+    "bot_telegram_api_seconds", "Время вызова Telegram Bot API", ("method",))
+TELEGRAM_ERRORS = REGISTRY.counter(
+    "bot_telegram_api_errors_total", "Ошибки Telegram Bot API по методу и коду (429, 403, network...)",
+    ("method", "code"))
+SQL_SECONDS = REGISTRY.histogram(
+    "bot_sqlite_query_seconds", "Время запроса к SQLite вместе с ожиданием блокировки соединения",
+    ("op",))
+REDIS_SECONDS = REGISTRY.histogram(
+    "bot_redis_seconds", "Время обращения к Redis (хранилище состояний и сессий)", ("command",))
+REDIS_ERRORS = REGISTRY.counter(
+    "bot_redis_errors_total", "Ошибки обращения к Redis", ("command",))
+OUTBOUND_WAIT_SECONDS = REGISTRY.histogram(
+    "bot_outbound_wait_seconds", "Ожидание лимитов перед вызовом Bot API", ("priority",))
+OUTBOUND_RETRIES = REGISTRY.counter(
+    "bot_outbound_retries_total", "Повторы вызовов Bot API после 429/5xx", ("priority", "code"))
+
+
+def observe_handler(name, handler, *args, **kwargs):
+    with HANDLER_SECONDS.time(handler=name):
+        try:
+            return handler(*args, **kwargs)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=name)
+            raise
+
+
+def timed_handler(handler):
+    # Для обработчиков, которые telebot вызывает сам (команды), а не через Router
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        return observe_handler(handler.__name__, handler, *args, **kwargs)
+    return wrapper
+
+
+def sql_op(sql):
+    # SELECT/INSERT/UPDATE/... — метка с малым числом значений
+    return sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ""
+
+
+# === ИНСТРУМЕНТИРОВАНИЕ БИБЛИОТЕК ===
+def instrument_telegram(apihelper):
+    # Все методы telebot проходят через apihelper._make_request (поиск имени в модуле при вызове)
+    original = apihelper._make_request
+    if getattr(original, "instrumented", False):
+        return
+
+    def _make_request(token, method_name, method='get', params=None, files=None):
+        started = time.perf_counter()
+        try:
+            return original(token, method_name, method=method, params=params, files=files)
+        except ApiTelegramException as e:
+            TELEGRAM_ERRORS.inc(method=method_name, code=e.error_code)
+            raise
+        except Exception:
+            TELEGRAM_ERRORS.inc(method=method_name, code="network")
+            raise
+        finally:
+            TELEGRAM_SECONDS.observe(time.perf_counter() - started, method=method_name)
+
+    _make_request.instrumented = True
+    apihelper._make_request = _make_request
+
+
+def instrument_redis(client):
+    # Обычные команды идут через execute_command, а StateRedisStorage пишет через transaction
+    # (WATCH/MULTI/EXEC) — она считается одной операцией
+    def timed(call, command_of):
+        def wrapper(*args, **kwargs):
+            command = command_of(args)
+            started = time.perf_counter()
+            try:
+                return call(*args, **kwargs)
+            except Exception:
+                REDIS_ERRORS.inc(command=command)
+                raise
+            finally:
+                REDIS_SECONDS.observe(time.perf_counter() - started, command=command)
+        wrapper.instrumented = True
+        return wrapper
+
+    if getattr(client.execute_command, "instrumented", False):
+        return
+    client.execute_command = timed(client.execute_command, lambda args: str(args[0]).upper() if args else "")
+    client.transaction = timed(client.transaction, lambda args: "TRANSACTION")
+
+
+# === ПРОФИЛИРОВЩИК ===
+# Раз в interval снимает стеки всех потоков (sys._current_frames) и копит их
+# в "свёрнутом" формате flamegraph: "файл:функция;...;файл:функция количество".
+class SamplingProfiler:
+    def __init__(self, interval=0.01, out_path=None, max_depth=64):
+        self.interval = interval
+        self.out_path = out_path
+        self.max_depth = max_depth
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self.thread.start()
+        print(f"Профилировщик включён: шаг {self.interval * 1000:.0f} мс")
+        return self
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            frames = sys._current_frames()
+            with self.lock:
+                self.samples += 1
+                for ident, frame in frames.items():
+                    if ident == own:
+                        continue
+                    stack = []
+                    while frame is not None and len(stack) < self.max_depth:
+                        code = frame.f_code
+                        stack.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}")
+                        frame = frame.f_back
+                    self.stacks[";".join(reversed(stack))] += 1
+
+    def collapsed(self):
+        with self.lock:
+            items = self.stacks.most_common()
+        return "".join(f"{stack} {count}\n" for stack, count in items)
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join(self.interval * 5)
+        if self.out_path:
+            try:
+                with open(self.out_path, "w", encoding="utf-8") as f:
+                    f.write(self.collapsed())
+                print(f"Профиль сохранён: {self.out_path} ({self.samples} снимков)")
+            except Exception as e:
+                print(f"Ошибка сохранения профиля: {e}")
+
+
+# === HTTP-ЭНДПОИНТ ===
+class MetricsServer:
+    def __init__(self, registry=REGISTRY, host="0.0.0.0", port=9090, profiler=None):
+        self.registry = registry
+        self.profiler = profiler
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    return self._reply(200, server.registry.render(), "text/plain; version=0.0.4; charset=utf-8")
+                if self.path == "/debug/profile" and server.profiler is not None:
+                    return self._reply(200, server.profiler.collapsed(), "text/plain; charset=utf-8")
+                self._reply(404, "", "text/plain")
+
+            def _reply(self, code, body, content_type):
+                data = body.encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        thread = threading.Thread(target=self.httpd.serve_forever, name="metrics-http", daemon=True)
+        thread.start()
+        print(f"Метрики: http://{self.httpd.server_address[0]}:{self.httpd.server_address[1]}/metrics")
+        return thread
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
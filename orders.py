@@ -0,0 +1,224 @@
+import datetime
+import threading
+import time
+from telebot.apihelper import ApiTelegramException
+from outbound import send_priority, NOTIFY
+
+# === ЗАЯВКИ ===
+# Заявки и запросы специалиста сначала записываются в users.db и только потом
+# уходят админу, поэтому ошибка отправки ничего не теряет: запись остаётся
+# с notified_at IS NULL и уйдёт в следующей сводке (в том числе после перезапуска).
+# Запись — групповой коммит: пока идёт одна транзакция, следующие заявки копятся
+# и попадают в одну общую. Уведомления склеиваются в сводки: первая заявка после
+# паузы уходит сразу, следующие в пределах digest_window — одним сообщением.
+# digest_window=0 — каждая заявка отдельным сообщением, без склейки.
+
+ORDERS_SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS orders (
+        order_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        username TEXT,
+        first_name TEXT,
+        bike TEXT,
+        frame_size TEXT,
+        contacts TEXT,
+        status TEXT NOT NULL DEFAULT 'new',
+        created_at TEXT NOT NULL,
+        notified_at TEXT
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS orders_status ON orders (status, order_id)",
+    "CREATE INDEX IF NOT EXISTS orders_unnotified ON orders (order_id) WHERE notified_at IS NULL",
+)
+
+ORDER_COLUMNS = (
+    "order_id", "kind", "user_id", "username", "first_name",
+    "bike", "frame_size", "contacts", "status", "created_at"
+)
+
+KIND_ORDER = "order"
+KIND_CALLBACK = "callback"
+
+NEW = "new"
+DONE = "done"
+
+# Лимит Telegram — 4096 символов, оставляем запас на заголовок
+MAX_MESSAGE = 3800
+
+# Контакты в списке заявок админки: 5 заявок на странице должны влезть в одно сообщение
+CONTACTS_PREVIEW = 300
+
+# Минимальная пауза после ошибки отправки — не зависит от окна сводки
+RETRY_PAUSE = 5.0
+
+
+def admin_unreachable(e):
+    # 4xx кроме 429 (бот заблокирован, неверный ADMIN_ID) повтором не лечится
+    return isinstance(e, ApiTelegramException) and 400 <= e.error_code < 500 and e.error_code != 429
+
+
+def format_order(order, contacts_limit=None):
+    if order["kind"] == KIND_CALLBACK:
+        return f"#{order['order_id']} Запрос от @{order['username'] or 'нет'} ({order['user_id']})"
+    contacts = order['contacts']
+    if contacts_limit is not None and contacts and len(contacts) > contacts_limit:
+        contacts = contacts[:contacts_limit] + "..."
+    text = (f"#{order['order_id']} Новая заявка:\n\nПользователь: {order['first_name']}\nID: {order['user_id']}\n"
+            f"Модель: {order['bike']}\nРазмер: {order['frame_size']}\nКонтакты: {contacts}")
+    # Контакты — произвольный текст пользователя, длинный не должен застрять в очереди навсегда
+    return text[:MAX_MESSAGE]
+
+
+class OrderBook:
+    def __init__(self, store, bot, admin_id, digest_window=10.0, digest_limit=50):
+        self.store = store
+        self.bot = bot
+        self.admin_id = admin_id
+        self.digest_window = digest_window
+        self.digest_limit = digest_limit
+        self.pending = []
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.last_sent = 0.0
+        self.thread = None
+        with store.transaction("CREATE_SCHEMA") as conn:
+            for sql in ORDERS_SCHEMA:
+                conn.execute(sql)
+
+    # --- запись ---
+    def add(self, kind, user_id, username=None, first_name=None, bike=None, frame_size=None, contacts=None):
+        # Возвращает order_id, когда заявка уже закоммичена
+        slot = {"row": (kind, str(user_id), username, first_name, bike, frame_size, contacts,
+                        datetime.datetime.now().isoformat()),
+                "order_id": None, "error": None}
+        with self.lock:
+            self.pending.append(slot)
+        with self.flush_lock:
+            # Пока ждали блокировку, нашу заявку мог записать чужой сброс
+            if slot["order_id"] is None and slot["error"] is None:
+                self._flush()
+        if slot["error"] is not None:
+            raise slot["error"]
+        self.wakeup.set()
+        return slot["order_id"]
+
+    def _flush(self):
+        with self.lock:
+            batch, self.pending = self.pending, []
+        try:
+            with self.store.transaction("INSERT_ORDERS") as conn:
+                for slot in batch:
+                    slot["order_id"] = conn.execute(
+                        "INSERT INTO orders (kind, user_id, username, first_name, bike, frame_size, contacts, created_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", slot["row"]
+                    ).lastrowid
+        except Exception as e:
+            for slot in batch:
+                slot["order_id"] = None
+                slot["error"] = e
+
+    def set_status(self, order_id, status):
+        self.store.write("UPDATE orders SET status = ? WHERE order_id = ?", (status, order_id))
+
+    # --- чтение ---
+    def open_count(self):
+        return self.store.execute("SELECT COUNT(*) FROM orders WHERE status = ?", (NEW,))[0][0]
+
+    def open_page(self, limit, after=None, before=None):
+        # Keyset по индексу (status, order_id), от новых к старым; after/before — order_id соседней страницы
+        columns = ', '.join(ORDER_COLUMNS)
+        if before is not None:
+            rows = self.store.execute(
+                f"SELECT {columns} FROM orders WHERE status = ? AND order_id > ? ORDER BY order_id ASC LIMIT ?",
+                (NEW, before, limit + 1)
+            )
+            more = len(rows) > limit
+            rows = rows[:limit][::-1]
+        else:
+            rows = self.store.execute(
+                f"SELECT {columns} FROM orders WHERE status = ? AND order_id < ? ORDER BY order_id DESC LIMIT ?",
+                (NEW, after if after is not None else 2 ** 63 - 1, limit + 1)
+            )
+            more = len(rows) > limit
+            rows = rows[:limit]
+        return [dict(zip(ORDER_COLUMNS, row)) for row in rows], more
+
+    # --- сводки админу ---
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="order-digest", daemon=True)
+            self.thread.start()
+            # Неотправленное до перезапуска уходит сразу
+            self.wakeup.set()
+
+    def _run(self):
+        while True:
+            self.wakeup.wait()
+            if self.stopped.is_set():
+                return
+            # Окно считается от прошлой сводки: после паузы первая заявка уходит сразу
+            wait = self.last_sent + self.digest_window - time.monotonic()
+            if wait > 0 and self.stopped.wait(wait):
+                return
+            self.wakeup.clear()
+            try:
+                self.send_digests()
+            except Exception as e:
+                self.last_sent = time.monotonic()
+                if admin_unreachable(e):
+                    # Заявки остаются в БД; пробуем снова только при новой заявке или перезапуске
+                    print(f"Админ недоступен, заявки сохранены без уведомления: {e}")
+                else:
+                    print(f"Ошибка отправки сводки заявок: {e}")
+                    self.wakeup.set()
+                if self.stopped.wait(max(self.digest_window, RETRY_PAUSE)):
+                    return
+
+    def send_digests(self):
+        sent = 0
+        while True:
+            rows = self.store.execute(
+                f"SELECT {', '.join(ORDER_COLUMNS)} FROM orders WHERE notified_at IS NULL ORDER BY order_id LIMIT ?",
+                (self.digest_limit,)
+            )
+            if not rows:
+                return sent
+            orders = [dict(zip(ORDER_COLUMNS, row)) for row in rows]
+            chunks = [[o] for o in orders] if self.digest_window <= 0 else self._chunks(orders)
+            for chunk in chunks:
+                if len(chunk) == 1:
+                    text = format_order(chunk[0])
+                else:
+                    text = f"Новые заявки ({len(chunk)}):\n\n" + "\n\n".join(format_order(o) for o in chunk)
+                with send_priority(NOTIFY):
+                    self.bot.send_message(self.admin_id, text)
+                self.last_sent = time.monotonic()
+                now = datetime.datetime.now().isoformat()
+                self.store.write_many(
+                    "UPDATE orders SET notified_at = ? WHERE order_id = ?",
+                    [(now, o["order_id"]) for o in chunk]
+                )
+                sent += len(chunk)
+
+    @staticmethod
+    def _chunks(orders):
+        chunk, size = [], 0
+        for order in orders:
+            length = len(format_order(order)) + 2
+            if chunk and size + length > MAX_MESSAGE:
+                yield chunk
+                chunk, size = [], 0
+            chunk.append(order)
+            size += length
+        if chunk:
+            yield chunk
+
+    def stop(self):
+        self.stopped.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join(5)
@@ -0,0 +1,144 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+from contextlib import contextmanager
+import requests
+from requests.adapters import HTTPAdapter
+from telebot.apihelper import ApiTelegramException
+from rate_limit import TokenBucket, ChatLimiter, GLOBAL_RATE, PER_CHAT_INTERVAL
+from metrics import OUTBOUND_WAIT_SECONDS, OUTBOUND_RETRIES
+
+# === ОБЩИЙ ПЛАНИРОВЩИК ИСХОДЯЩИХ ВЫЗОВОВ ===
+# Каждый вызов Bot API с chat_id (send_*, edit_*, delete_* ...) проходит через
+# один глобальный token bucket и лимит на чат. Токены выдаются по приоритету:
+# ответы пользователю раньше уведомлений админу, уведомления раньше рассылок —
+# поэтому рассылка не отнимает лимит у интерактивных ответов.
+# Приоритет задаётся для потока контекстом send_priority(BULK) и т.п.
+# 429 останавливает выдачу токенов на retry_after, 429/5xx повторяются с джиттером.
+
+INTERACTIVE = 0
+NOTIFY = 1
+BULK = 2
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", NOTIFY: "notify", BULK: "bulk"}
+
+_context = threading.local()
+
+
+@contextmanager
+def send_priority(priority):
+    previous = getattr(_context, "priority", INTERACTIVE)
+    _context.priority = priority
+    try:
+        yield
+    finally:
+        _context.priority = previous
+
+
+def current_priority():
+    return getattr(_context, "priority", INTERACTIVE)
+
+
+def retry_after(e):
+    return ((e.result_json or {}).get('parameters') or {}).get('retry_after', 1)
+
+
+class PriorityGate:
+    # Очередь ожидающих упорядочена по (приоритет, номер): токен берёт только голова,
+    # остальные ждут, пока она уйдёт. Новый интерактивный вызов сразу становится головой.
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.waiters = []
+        self.seq = itertools.count()
+        self.cond = threading.Condition()
+
+    def acquire(self, priority):
+        ticket = (priority, next(self.seq))
+        with self.cond:
+            heapq.heappush(self.waiters, ticket)
+            try:
+                while True:
+                    if self.waiters[0] == ticket:
+                        wait = self.bucket.reserve()
+                        if not wait:
+                            return
+                        self.cond.wait(wait)
+                    else:
+                        self.cond.wait()
+            finally:
+                self.waiters.remove(ticket)
+                heapq.heapify(self.waiters)
+                self.cond.notify_all()
+
+    def waiting(self):
+        with self.cond:
+            return len(self.waiters)
+
+
+class OutboundScheduler:
+    def __init__(self, rate=GLOBAL_RATE, chat_interval=PER_CHAT_INTERVAL, chat_burst=3,
+                 max_retries=3, backoff=0.5):
+        self.bucket = TokenBucket(rate)
+        self.gate = PriorityGate(self.bucket)
+        self.chats = ChatLimiter(chat_interval, burst=chat_burst)
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+    def call(self, chat_id, request, retry=True):
+        priority = current_priority()
+        name = PRIORITY_NAMES.get(priority, str(priority))
+        attempts = self.max_retries + 1 if retry else 1
+        for attempt in range(attempts):
+            with OUTBOUND_WAIT_SECONDS.time(priority=name):
+                # Интерактивный ответ не ждёт окна чата (пользователь сам его вызвал),
+                # но занимает его — фоновые отправки в этот чат встанут после
+                self.chats.acquire(chat_id, block=priority != INTERACTIVE)
+                self.gate.acquire(priority)
+            try:
+                return request()
+            except ApiTelegramException as e:
+                if attempt == attempts - 1 or not (e.error_code == 429 or e.error_code >= 500):
+                    raise
+                OUTBOUND_RETRIES.inc(priority=name, code=e.error_code)
+                if e.error_code == 429:
+                    # Ждать будут все: следующий acquire упрётся в паузу ведра
+                    pause = retry_after(e)
+                    self.bucket.pause(pause)
+                    self.chats.pause(chat_id, pause)
+                    time.sleep(random.uniform(0, self.backoff))
+                else:
+                    time.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+    def install(self, apihelper):
+        # Оборачивает apihelper._make_request: все методы telebot вызывают его по имени из модуля
+        original = apihelper._make_request
+        scheduler = self
+
+        def _make_request(token, method_name, method='get', params=None, files=None):
+            chat_id = params.get("chat_id") if params else None
+            if chat_id is None:
+                # getUpdates, answerCallbackQuery, setWebhook... в лимиты сообщений не входят
+                return original(token, method_name, method=method, params=params, files=files)
+            # _make_request меняет params (timeout) — на каждую попытку отдаём копию.
+            # Файл из потока повторно не прочитать, поэтому загрузки не повторяются
+            return scheduler.call(chat_id, lambda: original(
+                token, method_name, method=method, params=dict(params), files=files), retry=not files)
+
+        apihelper._make_request = _make_request
+
+
+def pooled_session(pool_size=32):
+    # Одна keep-alive сессия на все потоки вместо сессии на поток, пересоздаваемой раз в 10 минут
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def install_session(apihelper, pool_size=32):
+    apihelper.session = pooled_session(pool_size)
+    apihelper.SESSION_TIME_TO_LIVE = None
+    return apihelper.session
@@ -0,0 +1,78 @@
+import threading
+import time
+
+# === ОГРАНИЧЕНИЕ СКОРОСТИ ===
+# Лимиты Telegram: ~30 сообщений в секунду на бота и ~1 сообщение в секунду в один чат.
+
+GLOBAL_RATE = 30
+PER_CHAT_INTERVAL = 1.0
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        # Возвращает, сколько ждать до появления токена (0 — токен уже взят)
+        with self.lock:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        while True:
+            wait = self.reserve()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        # 429 с retry_after: останавливаем всех, кто берёт токены из этого ведра
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+
+class ChatLimiter:
+    # burst — сколько сообщений подряд можно отправить в чат без паузы,
+    # дальше в среднем одно на interval
+    def __init__(self, interval=PER_CHAT_INTERVAL, max_chats=10000, burst=1):
+        self.interval = interval
+        self.max_chats = max_chats
+        self.burst = burst
+        self.next_allowed = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, chat_id, block=True):
+        # block=False — отправить сразу и занять только ближайшее окно: очередь из
+        # быстрых нажатий пользователя не должна копиться перед фоновыми отправками
+        with self.lock:
+            now = time.monotonic()
+            if block:
+                slot = max(now, self.next_allowed.get(chat_id, 0.0))
+                self.next_allowed[chat_id] = slot + self.interval
+            else:
+                slot = now
+                self.next_allowed[chat_id] = max(self.next_allowed.get(chat_id, 0.0), now + self.interval)
+            if len(self.next_allowed) > self.max_chats:
+                # Чаты, у которых окно уже прошло, больше не нужны
+                self.next_allowed = {c: t for c, t in self.next_allowed.items() if t > now}
+        wait = slot - (self.burst - 1) * self.interval - now
+        if block and wait > 0:
+            time.sleep(wait)
+
+    def pause(self, chat_id, seconds):
+        with self.lock:
+            until = time.monotonic() + seconds
+            self.next_allowed[chat_id] = max(self.next_allowed.get(chat_id, 0.0), until)
@@ -0,0 +1,76 @@
+from metrics import observe_handler
+
+# === МАРШРУТИЗАЦИЯ ОБНОВЛЕНИЙ ===
+# Вместо цепочки лямбд telebot, которые проверяются по очереди, обработчик
+# находится поиском в словаре: точное совпадение (кнопки клавиатуры, фиксированные
+# callback_data), затем префикс по первому слову до "_", затем вхождение слова
+# (фразы, набранные вручную), затем один запасной обработчик.
+
+
+class Router:
+    def __init__(self, normalize=None):
+        self.normalize = normalize
+        self.exact = {}
+        # "specs_" -> [("specs_", handler, guard)]; в списке всего пара префиксов с общим первым словом
+        self.prefixes = {}
+        # [(слово, без учёта регистра, handler, guard)] — проверяются по порядку регистрации
+        self.contains = []
+        self.fallback_handler = None
+
+    def _key(self, key):
+        return self.normalize(key) if self.normalize else key
+
+    def on_exact(self, *keys, guard=None):
+        def decorator(handler):
+            for key in keys:
+                self.exact[self._key(key)] = (handler, guard)
+            return handler
+        return decorator
+
+    def on_prefix(self, *prefixes, guard=None):
+        def decorator(handler):
+            for prefix in prefixes:
+                head = prefix.split("_", 1)[0]
+                entries = self.prefixes.setdefault(head, [])
+                entries.append((prefix, handler, guard))
+                # Более длинный префикс проверяется первым
+                entries.sort(key=lambda entry: len(entry[0]), reverse=True)
+            return handler
+        return decorator
+
+    def on_contains(self, *words, guard=None, ignore_case=False):
+        # Регистр по умолчанию учитывается: normalize к этим словам не применяется
+        def decorator(handler):
+            for word in words:
+                self.contains.append((word.lower() if ignore_case else word, ignore_case, handler, guard))
+            return handler
+        return decorator
+
+    def on_fallback(self, handler):
+        self.fallback_handler = handler
+        return handler
+
+    def set_exact(self, keys, handler, guard=None):
+        # Атомарно заменяет набор ключей для обработчика (например, список моделей после перезагрузки)
+        exact = {k: v for k, v in self.exact.items() if v[0] is not handler}
+        for key in keys:
+            exact[self._key(key)] = (handler, guard)
+        self.exact = exact
+
+    def resolve(self, key, update):
+        if key:
+            entry = self.exact.get(self._key(key))
+            if entry and (entry[1] is None or entry[1](update)):
+                return entry[0]
+            for prefix, handler, guard in self.prefixes.get(key.split("_", 1)[0], ()):
+                if key.startswith(prefix) and (guard is None or guard(update)):
+                    return handler
+            for word, ignore_case, handler, guard in self.contains:
+                if word in (key.lower() if ignore_case else key) and (guard is None or guard(update)):
+                    return handler
+        return self.fallback_handler
+
+    def dispatch(self, update, key):
+        handler = self.resolve(key, update)
+        if handler is not None:
+            return observe_handler(handler.__name__, handler, update)
@@ -0,0 +1,76 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# === СЕССИИ ПОЛЬЗОВАТЕЛЕЙ ===
+# Короткоживущее состояние (выбранная модель и размер при заказе).
+# Основное хранилище — Redis с TTL, общий для всех процессов бота.
+# Если Redis недоступен, используется локальный LRU-словарь с тем же TTL
+# и ограничением на число записей, чтобы память не росла бесконечно.
+
+
+class SessionStore:
+    def __init__(self, redis_client=None, prefix="session", ttl=3600, max_entries=10000):
+        self.redis = redis_client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.local = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _key(self, user_id):
+        return f"{self.prefix}:{user_id}"
+
+    def get(self, user_id):
+        if self.redis is not None:
+            try:
+                raw = self.redis.get(self._key(user_id))
+                return json.loads(raw) if raw else {}
+            except Exception as e:
+                print(f"Redis недоступен, сессия из памяти: {e}")
+        return self._local_get(user_id)
+
+    def set(self, user_id, data):
+        if self.redis is not None:
+            try:
+                self.redis.set(self._key(user_id), json.dumps(data, ensure_ascii=False), ex=self.ttl)
+                return
+            except Exception as e:
+                print(f"Redis недоступен, сессия в памяти: {e}")
+        self._local_set(user_id, data)
+
+    def update(self, user_id, **fields):
+        data = self.get(user_id)
+        data.update(fields)
+        self.set(user_id, data)
+        return data
+
+    def delete(self, user_id):
+        if self.redis is not None:
+            try:
+                self.redis.delete(self._key(user_id))
+            except Exception as e:
+                print(f"Redis недоступен: {e}")
+        with self.lock:
+            self.local.pop(user_id, None)
+
+    # --- локальный LRU с TTL ---
+    def _local_get(self, user_id):
+        with self.lock:
+            entry = self.local.get(user_id)
+            if entry is None:
+                return {}
+            expires, data = entry
+            if expires < time.monotonic():
+                del self.local[user_id]
+                return {}
+            self.local.move_to_end(user_id)
+            return dict(data)
+
+    def _local_set(self, user_id, data):
+        with self.lock:
+            self.local[user_id] = (time.monotonic() + self.ttl, dict(data))
+            self.local.move_to_end(user_id)
+            while len(self.local) > self.max_entries:
+                self.local.popitem(last=False)
@@ -5,7 +5,8 @@ echo "Файлы в корне:"
 ls -la
 echo "Файлы в /app:"
 ls -la /app || echo "/app не существует"
-echo "Копируем bot.py → /app/bot.py"
-cp bot.py /app/bot.py && echo "Копирование УСПЕШНО" || echo "ОШИБКА копирования"
+# bot.py импортирует соседние модули и читает catalog.json рядом с собой — копируем всё
+echo "Копируем *.py и catalog.json → /app/"
+cp *.py catalog.json /app/ && echo "Копирование УСПЕШНО" || echo "ОШИБКА копирования"
 echo "Запускаем бота..."
 python /app/bot.py
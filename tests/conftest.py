@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+# Модули бота лежат в корне репозитория без пакета
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from user_store import UserStore  # noqa: E402
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = UserStore(str(tmp_path / "users.db"))
+    yield store
+    store.close()
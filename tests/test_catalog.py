@@ -0,0 +1,52 @@
+import copy
+import json
+import os
+
+import pytest
+
+from catalog import Catalog, validate_catalog, MAX_CAPTION
+
+REPO_CATALOG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "catalog.json")
+
+
+@pytest.fixture
+def data():
+    with open(REPO_CATALOG, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def first_bike(data):
+    return next(iter(data["bikes"].values()))
+
+
+def test_repo_catalog_is_valid(data):
+    validate_catalog(data)
+
+
+@pytest.mark.parametrize("breaks", [
+    lambda d: first_bike(d).update(photos=[]),
+    lambda d: first_bike(d).pop("specs"),
+    lambda d: first_bike(d).update(description="x" * (MAX_CAPTION + 1)),
+    lambda d: d["bikes"].update({"Очень длинное название модели велосипеда": copy.deepcopy(first_bike(d))}),
+])
+def test_invalid_catalog_is_rejected(data, breaks):
+    breaks(data)
+    with pytest.raises(ValueError):
+        validate_catalog(data)
+
+
+def test_caption_limit_ignores_html_markup(data):
+    first_bike(data)["description"] = "<b>x</b>" * MAX_CAPTION
+    validate_catalog(data)
+
+
+def test_check_keeps_previous_snapshot_on_bad_file(tmp_path, data):
+    path = tmp_path / "catalog.json"
+    path.write_text(json.dumps(data), encoding="utf-8")
+    catalog = Catalog(str(path))
+    good = catalog.current
+    first_bike(data)["description"] = "x" * (MAX_CAPTION + 1)
+    path.write_text(json.dumps(data), encoding="utf-8")
+    os.utime(path, ns=(0, catalog.mtime + 1))
+    assert catalog.check() is False
+    assert catalog.current is good
@@ -0,0 +1,107 @@
+import threading
+import time
+
+from telebot.apihelper import ApiTelegramException
+
+from orders import OrderBook, format_order, KIND_ORDER, KIND_CALLBACK, DONE, CONTACTS_PREVIEW
+
+
+class FakeBot:
+    def __init__(self, error_code=None):
+        self.error_code = error_code
+        self.sent = []
+
+    def send_message(self, chat_id, text):
+        self.sent.append(text)
+        if self.error_code:
+            raise ApiTelegramException("sendMessage", None, {"error_code": self.error_code, "description": "Forbidden"})
+
+
+def wait_for(condition, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_concurrent_add_returns_committed_ids(store):
+    orders = OrderBook(store, FakeBot(), admin_id=1)
+    ids = []
+    lock = threading.Lock()
+
+    def add(i):
+        order_id = orders.add(KIND_ORDER, 100 + i, bike="PRIMO", frame_size="M", contacts=f"+7 {i}")
+        # Заявка уже в БД, когда add() вернул id
+        assert store.execute("SELECT user_id FROM orders WHERE order_id = ?", (order_id,)) == [(str(100 + i),)]
+        with lock:
+            ids.append(order_id)
+
+    threads = [threading.Thread(target=add, args=(i,)) for i in range(50)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(ids) == len(set(ids)) == 50
+    assert store.execute("SELECT COUNT(*) FROM orders")[0][0] == 50
+
+
+def test_open_page_and_close(store):
+    orders = OrderBook(store, FakeBot(), admin_id=1)
+    ids = [orders.add(KIND_CALLBACK, i) for i in range(7)]
+    orders.set_status(ids[-1], DONE)
+
+    first, more = orders.open_page(3)
+    assert [o["order_id"] for o in first] == ids[5:2:-1] and more
+    second, more = orders.open_page(3, after=first[-1]["order_id"])
+    assert [o["order_id"] for o in second] == ids[2::-1] and not more
+    back, _ = orders.open_page(3, before=second[0]["order_id"])
+    assert back == first
+    assert orders.open_count() == 6
+
+
+def test_long_contacts_are_cut_in_admin_list(store):
+    orders = OrderBook(store, FakeBot(), admin_id=1)
+    for i in range(5):
+        orders.add(KIND_ORDER, i, first_name="Иван", bike="PRIMO", frame_size="M", contacts="8900 " * 1000)
+    rows, _ = orders.open_page(5)
+    # Страница из 5 заявок со всеми подписями влезает в лимит Telegram (4096)
+    assert sum(len(format_order(o, CONTACTS_PREVIEW)) + 40 for o in rows) < 4096
+    # В сводке админу контакты не обрезаются
+    assert "8900 " * 500 in format_order(rows[0])
+
+
+def test_digest_coalesces_and_marks_notified(store):
+    bot = FakeBot()
+    orders = OrderBook(store, bot, admin_id=1, digest_window=60)
+    for i in range(5):
+        orders.add(KIND_CALLBACK, i)
+    orders.send_digests()
+    assert len(bot.sent) == 1 and bot.sent[0].startswith("Новые заявки (5)")
+    assert store.execute("SELECT COUNT(*) FROM orders WHERE notified_at IS NULL")[0][0] == 0
+
+
+def test_zero_window_sends_each_order_separately(store):
+    bot = FakeBot()
+    orders = OrderBook(store, bot, admin_id=1, digest_window=0)
+    for i in range(3):
+        orders.add(KIND_CALLBACK, i)
+    orders.send_digests()
+    assert len(bot.sent) == 3
+
+
+def test_unreachable_admin_is_not_hammered(store):
+    bot = FakeBot(error_code=403)
+    orders = OrderBook(store, bot, admin_id=1, digest_window=0)
+    orders.start()
+    try:
+        orders.add(KIND_CALLBACK, 1)
+        assert wait_for(lambda: bot.sent)
+        time.sleep(0.5)
+        assert len(bot.sent) == 1
+    finally:
+        orders.stop()
+    # Заявка осталась неотправленной и уйдёт позже
+    assert store.execute("SELECT COUNT(*) FROM orders WHERE notified_at IS NULL")[0][0] == 1
@@ -0,0 +1,44 @@
+import threading
+import time
+
+from rate_limit import TokenBucket
+from outbound import PriorityGate, INTERACTIVE, NOTIFY, BULK
+
+
+def wait_for(condition, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_gate_passes_immediately_when_tokens_available():
+    gate = PriorityGate(TokenBucket(rate=100, capacity=3))
+    for priority in (BULK, NOTIFY, INTERACTIVE):
+        gate.acquire(priority)
+    assert gate.waiting() == 0
+
+
+def test_interactive_overtakes_waiting_bulk():
+    bucket = TokenBucket(rate=5, capacity=1)
+    gate = PriorityGate(bucket)
+    gate.acquire(BULK)
+    order = []
+
+    def take(priority):
+        gate.acquire(priority)
+        order.append(priority)
+
+    threads = [threading.Thread(target=take, args=(BULK,)), threading.Thread(target=take, args=(NOTIFY,))]
+    for t in threads:
+        t.start()
+    assert wait_for(lambda: gate.waiting() == 2)
+    # Интерактивный вызов пришёл последним, но токен получает первым
+    threads.append(threading.Thread(target=take, args=(INTERACTIVE,)))
+    threads[-1].start()
+    for t in threads:
+        t.join(5)
+    assert order == [INTERACTIVE, NOTIFY, BULK]
+    assert gate.waiting() == 0
@@ -0,0 +1,49 @@
+import rate_limit
+from rate_limit import ChatLimiter, TokenBucket
+
+
+def record_sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(rate_limit.time, "sleep", sleeps.append)
+    return sleeps
+
+
+def test_chat_limiter_allows_burst_then_spaces_sends(monkeypatch):
+    sleeps = record_sleeps(monkeypatch)
+    limiter = ChatLimiter(interval=10, burst=3)
+    for _ in range(3):
+        limiter.acquire(1)
+    assert sleeps == []
+    limiter.acquire(1)
+    assert len(sleeps) == 1 and 9 < sleeps[0] <= 10
+    # Другой чат ждать не должен
+    limiter.acquire(2)
+    assert len(sleeps) == 1
+
+
+def test_interactive_sends_do_not_queue_background_ones(monkeypatch):
+    sleeps = record_sleeps(monkeypatch)
+    limiter = ChatLimiter(interval=10, burst=1)
+    for _ in range(30):
+        limiter.acquire(1, block=False)
+    assert sleeps == []
+    # После 30 быстрых нажатий фоновая отправка ждёт одно окно, а не 30
+    limiter.acquire(1)
+    assert len(sleeps) == 1 and sleeps[0] <= 10
+
+
+def test_chat_limiter_pause(monkeypatch):
+    sleeps = record_sleeps(monkeypatch)
+    limiter = ChatLimiter(interval=1, burst=1)
+    limiter.pause(1, 30)
+    limiter.acquire(1)
+    assert len(sleeps) == 1 and 29 < sleeps[0] <= 30
+
+
+def test_token_bucket_reserve_and_pause():
+    bucket = TokenBucket(rate=1, capacity=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert 0 < bucket.reserve() <= 1
+    bucket.pause(60)
+    assert 59 < bucket.reserve() <= 60
@@ -0,0 +1,63 @@
+from router import Router
+
+
+def build_text_router(broadcasting=False):
+    # Та же схема, что у text_routes в bot.py
+    routes = Router(normalize=lambda text: text.strip().lower())
+    not_broadcasting = lambda msg: not broadcasting
+
+    @routes.on_exact("Позвать специалиста")
+    def call_specialist(msg):
+        return "specialist"
+
+    @routes.on_exact("Каталог")
+    def catalog(msg):
+        return "catalog"
+
+    @routes.on_fallback
+    def route_free_text(msg):
+        return "broadcast" if broadcasting else "fallback"
+
+    routes.on_contains("специалиста", ignore_case=True, guard=not_broadcasting)(call_specialist)
+    routes.on_contains("Каталог", guard=not_broadcasting)(catalog)
+    return routes
+
+
+def route(routes, text):
+    return routes.resolve(text, text).__name__
+
+
+def test_exact_buttons_ignore_case_and_spaces():
+    routes = build_text_router()
+    assert route(routes, " каталог ") == "catalog"
+    assert route(routes, "ПОЗВАТЬ СПЕЦИАЛИСТА") == "call_specialist"
+
+
+def test_typed_phrases_match_like_baseline():
+    routes = build_text_router()
+    assert route(routes, "Хочу СПЕЦИАЛИСТА") == "call_specialist"
+    assert route(routes, "Покажите Каталог") == "catalog"
+
+
+def test_contacts_mentioning_catalog_fall_through_to_order():
+    routes = build_text_router()
+    # "каталога" со строчной — это контакты, а не просьба открыть каталог
+    assert route(routes, "Иван, модель из каталога, 89001234567") == "route_free_text"
+
+
+def test_guard_sends_broadcast_text_to_fallback():
+    routes = build_text_router(broadcasting=True)
+    assert route(routes, "Каталог обновлён, заходите!") == "route_free_text"
+
+
+def test_prefix_routes_prefer_longest_prefix():
+    routes = Router()
+    routes.on_prefix("orders_")(lambda call: "orders")
+
+    @routes.on_prefix("orders_close_")
+    def close(call):
+        return "close"
+
+    assert routes.resolve("orders_close_7", None) is close
+    assert routes.resolve("orders_next_1_5", None)(None) == "orders"
+    assert routes.resolve("other", None) is None
@@ -0,0 +1,80 @@
+from user_store import UserStore
+
+
+def test_upsert_and_touch_update_counters(store):
+    store.upsert_user(1, "a", "Ann", None, "2026-10-17T10:00:00")
+    store.upsert_user(2, "b", "Bob", None, "2026-10-18T09:00:00")
+    # Повторный upsert того же пользователя не добавляет его второй раз
+    store.upsert_user(1, "a2", "Ann", "Lee", "2026-10-18T10:00:00")
+    store.touch_users([(2, "2026-10-18T11:00:00", 3), (3, "2026-10-18T12:00:00", 2)])
+    store.touch_user(1, "2026-10-18T13:00:00")
+
+    assert store.count_users() == 3
+    assert store.stats("2026-10-18") == {"total": 3, "messages": 9, "active_today": 3}
+    assert store.stats("2026-10-17")["active_today"] == 1
+    assert store.get_user(1)["full_name"] == "Ann Lee"
+
+
+def test_daily_active_counts_each_user_once(store):
+    for hour in range(10, 15):
+        store.touch_user(7, f"2026-10-18T{hour}:00:00")
+    store.touch_users([(7, "2026-10-18T16:00:00", 1), (8, "2026-10-18T16:00:00", 1)])
+    assert store.stats("2026-10-18")["active_today"] == 2
+
+
+def test_rebuild_stats_reports_no_drift_after_normal_writes(store):
+    store.upsert_user(1, "a", "Ann", None, "2026-10-18T10:00:00")
+    store.touch_users([(2, "2026-10-18T11:00:00", 4)])
+    drift = store.rebuild_stats()
+    assert all(old == new for old, new in drift.values())
+
+
+def test_rebuild_stats_reports_and_fixes_drift(store):
+    store.upsert_user(1, "a", "Ann", None, "2026-10-18T10:00:00")
+    store.write("UPDATE counters SET value = 42 WHERE name = 'total_users'")
+    drift = store.rebuild_stats()
+    assert drift["total_users"] == (42, 1)
+    assert store.count_users() == 1
+
+
+def test_old_daily_active_pairs_are_pruned(store):
+    for day in ("2026-10-15", "2026-10-16", "2026-10-17"):
+        store.touch_users([(1, f"{day}T10:00:00", 1), (2, f"{day}T11:00:00", 1)])
+    store.touch_users([(1, "2026-10-18T10:00:00", 1)])
+    # Остались только пары вчерашнего и сегодняшнего дня, итоги прошлых дней на месте
+    assert [day for (day,) in store.execute("SELECT DISTINCT day FROM daily_active ORDER BY day")] == [
+        "2026-10-17", "2026-10-18"]
+    assert store.stats("2026-10-15")["active_today"] == 2
+    # Повторная активность сегодня не считается второй раз
+    store.touch_users([(1, "2026-10-18T12:00:00", 1)])
+    assert store.stats("2026-10-18")["active_today"] == 1
+
+
+def test_rebuild_stats_keeps_history(store):
+    for day in ("2026-10-15", "2026-10-16"):
+        store.touch_users([(1, f"{day}T10:00:00", 1), (2, f"{day}T11:00:00", 1)])
+    store.touch_users([(3, "2026-10-18T10:00:00", 1)])
+    drift = store.rebuild_stats()
+    assert all(old == new for old, new in drift.values())
+    # По users за 15-е восстановить было бы нечего: последний день обоих — 16-е
+    assert store.stats("2026-10-15")["active_today"] == 2
+    assert store.stats("2026-10-16")["active_today"] == 2
+    assert store.stats("2026-10-18")["active_today"] == 1
+    assert store.execute("SELECT COUNT(*) FROM daily_active WHERE day < '2026-10-17'")[0][0] == 0
+
+
+def test_counters_seeded_for_existing_database(tmp_path):
+    path = str(tmp_path / "old.db")
+    store = UserStore(path)
+    store.touch_users([(1, "2026-10-18T10:00:00", 2), (2, "2026-10-18T10:00:00", 1)])
+    # База до появления счётчиков: без служебных таблиц и триггеров
+    with store.transaction("TEST") as conn:
+        for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'").fetchall():
+            conn.execute(f"DROP TRIGGER {name}")
+        for table in ("counters", "daily_active", "daily_stats"):
+            conn.execute(f"DROP TABLE {table}")
+    store.close()
+
+    store = UserStore(path)
+    assert store.stats("2026-10-18") == {"total": 2, "messages": 3, "active_today": 2}
+    store.close()
@@ -0,0 +1,58 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from metrics import Registry
+from webhook import WebhookServer
+
+
+class FakeExecutor:
+    def submit(self, update, block=True):
+        return True
+
+    def depth(self):
+        return 0
+
+    def stats(self):
+        return {"0": {"queued": 0}}
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def start(**kwargs):
+        server = WebhookServer(FakeExecutor(), host="127.0.0.1", port=0, secret="s", **kwargs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.httpd.server_address[1]}"
+    yield start
+    for server in servers:
+        server.httpd.shutdown()
+        server.close()
+
+
+def get(url):
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.status, response.read().decode("utf-8")
+    except urllib.error.HTTPError as e:
+        return e.code, ""
+
+
+def test_public_port_hides_metrics_by_default(serve):
+    base = serve()
+    assert get(base + "/metrics")[0] == 404
+    assert get(base + "/health") == (200, json.dumps({"status": "ok"}))
+
+
+def test_metrics_on_webhook_port_are_opt_in(serve):
+    registry = Registry()
+    registry.counter("test_total", "Тестовый счётчик").inc()
+    base = serve(metrics=registry)
+    status, body = get(base + "/metrics")
+    assert status == 200 and "test_total 1" in body
+    assert "lanes" in json.loads(get(base + "/health")[1])
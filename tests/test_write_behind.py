@@ -0,0 +1,39 @@
+from activity_buffer import ActivityBuffer
+from events import EventLog, BIKE_VIEW, ORDER
+
+
+def test_activity_buffer_merges_and_flushes(store):
+    store.upsert_user("1", "u", "Иван", None, "2024-01-01T10:00:00")
+    buffer = ActivityBuffer(store)
+    buffer.record("1", "2024-01-01T11:00:00")
+    buffer.record("1", "2024-01-01T12:00:00")
+    assert buffer.pending == {"1": ["2024-01-01T12:00:00", 2]}
+    assert buffer.flush() == 1
+    assert buffer.pending == {}
+    assert store.stats("2024-01-01")["messages"] == 3
+
+
+def test_failed_write_is_restored(store):
+    buffer = ActivityBuffer(store)
+    buffer.record("1", "2024-01-01T11:00:00")
+
+    def broken(rows):
+        raise RuntimeError("disk full")
+
+    store.touch_users, original = broken, store.touch_users
+    assert buffer.flush() == 0
+    buffer.record("1", "2024-01-01T12:00:00")
+    assert buffer.pending == {"1": ["2024-01-01T12:00:00", 2]}
+    store.touch_users = original
+
+
+def test_max_pending_flushes_inline(store):
+    events = EventLog(store, flush_batch=10, max_pending=3)
+    for uid in range(3):
+        events.record(BIKE_VIEW, uid, "PRIMO")
+    # Третья запись упёрлась в предел и сбросила буфер без фонового потока
+    assert events.pending == []
+    events.record(BIKE_VIEW, 0, "PRIMO")
+    events.record(ORDER, 0, "PRIMO")
+    events.stop()
+    assert events.funnel()["PRIMO"] == {BIKE_VIEW: (4, 3), ORDER: (1, 1)}
@@ -0,0 +1,321 @@
+import datetime
+import sqlite3
+import threading
+from contextlib import contextmanager
+from metrics import SQL_SECONDS, sql_op
+
+# === ХРАНИЛИЩЕ ПОЛЬЗОВАТЕЛЕЙ ===
+# Одно долгоживущее соединение в режиме WAL. telebot вызывает обработчики
+# из нескольких потоков, поэтому все обращения к соединению идут под блокировкой.
+
+USER_COLUMNS = (
+    "user_id", "username", "first_name", "last_name", "full_name",
+    "first_seen", "last_activity", "messages_count"
+)
+
+
+# === СЧЁТЧИКИ СТАТИСТИКИ ===
+# Поддерживаются триггерами в той же транзакции, что и запись в users,
+# поэтому админка читает готовые значения за O(1).
+# daily_active хранит пары (день, пользователь), daily_stats — число уникальных за день.
+# Пары нужны только для текущего дня (и вчерашнего — для поздних сбросов буфера):
+# итоги прошлых дней уже лежат в daily_stats, поэтому старые пары удаляются при смене дня.
+# В телах триггеров нет ON CONFLICT/OR IGNORE: их перекрывает конфликт-политика
+# внешнего UPSERT, поэтому дубликаты отсекаются через NOT EXISTS.
+STATS_SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS counters (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS daily_active (
+        day TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        PRIMARY KEY (day, user_id)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS daily_stats (
+        day TEXT PRIMARY KEY,
+        active_users INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS users_stats_insert AFTER INSERT ON users
+    BEGIN
+        UPDATE counters SET value = value + 1 WHERE name = 'total_users';
+        UPDATE counters SET value = value + COALESCE(NEW.messages_count, 0) WHERE name = 'total_messages';
+        INSERT INTO daily_active (day, user_id)
+            SELECT substr(NEW.last_activity, 1, 10), NEW.user_id
+            WHERE NEW.last_activity IS NOT NULL AND NOT EXISTS (
+                SELECT 1 FROM daily_active WHERE day = substr(NEW.last_activity, 1, 10) AND user_id = NEW.user_id
+            );
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS users_stats_delete AFTER DELETE ON users
+    BEGIN
+        UPDATE counters SET value = value - 1 WHERE name = 'total_users';
+        UPDATE counters SET value = value - COALESCE(OLD.messages_count, 0) WHERE name = 'total_messages';
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS users_stats_messages AFTER UPDATE OF messages_count ON users
+    BEGIN
+        UPDATE counters
+            SET value = value + COALESCE(NEW.messages_count, 0) - COALESCE(OLD.messages_count, 0)
+            WHERE name = 'total_messages';
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS users_stats_activity AFTER UPDATE OF last_activity ON users
+    WHEN NEW.last_activity IS NOT NULL
+    BEGIN
+        INSERT INTO daily_active (day, user_id)
+            SELECT substr(NEW.last_activity, 1, 10), NEW.user_id
+            WHERE NOT EXISTS (
+                SELECT 1 FROM daily_active WHERE day = substr(NEW.last_activity, 1, 10) AND user_id = NEW.user_id
+            );
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS daily_active_insert AFTER INSERT ON daily_active
+    BEGIN
+        INSERT INTO daily_stats (day, active_users)
+            SELECT NEW.day, 0 WHERE NOT EXISTS (SELECT 1 FROM daily_stats WHERE day = NEW.day);
+        UPDATE daily_stats SET active_users = active_users + 1 WHERE day = NEW.day;
+    END
+    ''',
+)
+
+
+def row_to_user(row):
+    return dict(zip(USER_COLUMNS, row))
+
+
+class UserStore:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=30000")
+        # Последний день, для которого удалены старые пары daily_active
+        self.pruned_day = None
+        self.ensure_schema()
+
+    def ensure_schema(self):
+        with self.lock, self.conn:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS users (
+                    user_id TEXT PRIMARY KEY,
+                    username TEXT,
+                    first_name TEXT,
+                    last_name TEXT,
+                    full_name TEXT,
+                    first_seen TEXT,
+                    last_activity TEXT,
+                    messages_count INTEGER
+                )
+            ''')
+            initialized = self.conn.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'counters'"
+            ).fetchone()[0]
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS users_last_activity ON users (last_activity, user_id)"
+            )
+            for sql in STATS_SCHEMA:
+                self.conn.execute(sql)
+            self.conn.execute(
+                "INSERT OR IGNORE INTO counters (name, value) VALUES ('total_users', 0), ('total_messages', 0)"
+            )
+        if not initialized:
+            # Первый запуск со счётчиками на существующей базе — заполняем их по таблице users
+            self.rebuild_stats()
+
+    def execute(self, sql, params=()):
+        with SQL_SECONDS.time(op=sql_op(sql)), self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def write(self, sql, params=()):
+        with SQL_SECONDS.time(op=sql_op(sql)), self.lock, self.conn:
+            self.conn.execute(sql, params)
+
+    def write_many(self, sql, rows):
+        with SQL_SECONDS.time(op=sql_op(sql) + "_MANY"), self.lock, self.conn:
+            self.conn.executemany(sql, rows)
+
+    @contextmanager
+    def transaction(self, op):
+        # Несколько запросов одной транзакцией; время целиком идёт в метрику с меткой op
+        with SQL_SECONDS.time(op=op), self.lock, self.conn:
+            yield self.conn
+
+    # --- запись ---
+    def upsert_user(self, user_id, username, first_name, last_name, now):
+        full_name = f"{first_name or ''} {last_name or ''}".strip() or None
+        self.write('''
+            INSERT INTO users (user_id, username, first_name, last_name, full_name,
+                               first_seen, last_activity, messages_count)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 1)
+            ON CONFLICT(user_id) DO UPDATE SET
+                username = excluded.username,
+                first_name = excluded.first_name,
+                last_name = excluded.last_name,
+                full_name = excluded.full_name,
+                last_activity = excluded.last_activity,
+                messages_count = COALESCE(users.messages_count, 0) + 1
+        ''', (str(user_id), username, first_name, last_name, full_name, now, now))
+
+    TOUCH_SQL = '''
+        INSERT INTO users (user_id, first_seen, last_activity, messages_count)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            last_activity = MAX(COALESCE(users.last_activity, ''), excluded.last_activity),
+            messages_count = COALESCE(users.messages_count, 0) + excluded.messages_count
+    '''
+
+    def touch_user(self, user_id, now, count=1):
+        self.write(self.TOUCH_SQL, (str(user_id), now, now, count))
+
+    def touch_users(self, rows):
+        # rows: [(user_id, last_activity, count), ...] — одна транзакция на пачку
+        if rows:
+            self.prune_daily_active(max(now for _, now, _ in rows)[:10])
+        self.write_many(self.TOUCH_SQL, [(str(uid), now, now, count) for uid, now, count in rows])
+
+    # --- чтение ---
+    def get_user(self, user_id):
+        rows = self.execute(
+            f"SELECT {', '.join(USER_COLUMNS)} FROM users WHERE user_id = ?", (str(user_id),)
+        )
+        return row_to_user(rows[0]) if rows else None
+
+    def count_users(self):
+        rows = self.execute("SELECT value FROM counters WHERE name = 'total_users'")
+        return rows[0][0] if rows else 0
+
+    def stats(self, day):
+        counters = dict(self.execute("SELECT name, value FROM counters"))
+        rows = self.execute("SELECT active_users FROM daily_stats WHERE day = ?", (day,))
+        return {
+            'total': counters.get('total_users', 0),
+            'messages': counters.get('total_messages', 0),
+            'active_today': rows[0][0] if rows else 0
+        }
+
+    @staticmethod
+    def _cutoff(day):
+        return (datetime.date.fromisoformat(day) - datetime.timedelta(days=1)).isoformat()
+
+    def prune_daily_active(self, day):
+        # day — самый свежий день активности; чистим раз на каждый новый день
+        if self.pruned_day is not None and day <= self.pruned_day:
+            return
+        self.write("DELETE FROM daily_active WHERE day < ?", (self._cutoff(day),))
+        self.pruned_day = day
+
+    def rebuild_stats(self):
+        # Пересчёт счётчиков по users.db. Возвращает {имя: (было, стало)} для проверки расхождений.
+        # Пересчитываются только последние два дня (по daily_active и таблице users);
+        # итоги прошлых дней в daily_stats сохраняются, недостающие дни дополняются по users
+        # (там есть только последний день активности каждого пользователя).
+        with self.transaction("REBUILD_STATS") as conn:
+            before = dict(conn.execute("SELECT name, value FROM counters"))
+            before_days = dict(conn.execute("SELECT day, active_users FROM daily_stats"))
+            total, messages, latest = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(messages_count), 0), MAX(last_activity) FROM users"
+            ).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO counters (name, value) VALUES ('total_users', ?), ('total_messages', ?)",
+                (total, messages)
+            )
+            if latest:
+                cutoff = self._cutoff(latest[:10])
+                conn.execute("DELETE FROM daily_active WHERE day < ?", (cutoff,))
+                conn.execute('''
+                    INSERT OR IGNORE INTO daily_active (day, user_id)
+                    SELECT substr(last_activity, 1, 10), user_id FROM users WHERE last_activity >= ?
+                ''', (cutoff,))
+                conn.execute("DELETE FROM daily_stats WHERE day >= ?", (cutoff,))
+                conn.execute('''
+                    INSERT INTO daily_stats (day, active_users)
+                    SELECT day, COUNT(*) FROM daily_active GROUP BY day
+                ''')
+                conn.execute('''
+                    INSERT INTO daily_stats (day, active_users)
+                    SELECT day, active FROM (
+                        SELECT substr(last_activity, 1, 10) AS day, COUNT(*) AS active
+                        FROM users WHERE last_activity < ? GROUP BY day
+                    ) WHERE day NOT IN (SELECT day FROM daily_stats)
+                ''', (cutoff,))
+            after_days = dict(conn.execute("SELECT day, active_users FROM daily_stats"))
+        drift = {
+            'total_users': (before.get('total_users', 0), total),
+            'total_messages': (before.get('total_messages', 0), messages),
+        }
+        for day, value in after_days.items():
+            if before_days.get(day) != value:
+                drift[f"active {day}"] = (before_days.get(day, 0), value)
+        return drift
+
+    def users_page(self, limit, after=None, before=None):
+        # Keyset-пагинация по индексу (last_activity, user_id), от новых к старым.
+        # after/before — курсор (last_activity, user_id) крайней строки соседней страницы.
+        # Возвращает (строки страницы, есть ли ещё строки в направлении перехода).
+        columns = ', '.join(USER_COLUMNS)
+        if before is not None:
+            rows = self.execute(f'''
+                SELECT {columns} FROM users
+                WHERE (last_activity, user_id) > (?, ?)
+                ORDER BY last_activity ASC, user_id ASC LIMIT ?
+            ''', (*before, limit + 1))
+            more = len(rows) > limit
+            rows = rows[:limit][::-1]
+        else:
+            where, params = "", ()
+            if after is not None:
+                where, params = "WHERE (last_activity, user_id) < (?, ?)", tuple(after)
+            rows = self.execute(f'''
+                SELECT {columns} FROM users {where}
+                ORDER BY last_activity DESC, user_id DESC LIMIT ?
+            ''', (*params, limit + 1))
+            more = len(rows) > limit
+            rows = rows[:limit]
+        return [row_to_user(row) for row in rows], more
+
+    def iter_users(self, chunk=1000):
+        # Обход всей таблицы пачками по первичному ключу: блокировка берётся на одну пачку,
+        # запись в users между пачками не ждёт, в памяти не больше chunk строк
+        columns = ', '.join(USER_COLUMNS)
+        last = ""
+        while True:
+            rows = self.execute(
+                f"SELECT {columns} FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?", (last, chunk)
+            )
+            for row in rows:
+                yield row_to_user(row)
+            if len(rows) < chunk:
+                return
+            last = rows[-1][0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+# === РАЗОВЫЙ ПЕРЕСЧЁТ: python user_store.py rebuild-stats [users.db] ===
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2 or sys.argv[1] != "rebuild-stats":
+        print("Использование: python user_store.py rebuild-stats [путь к users.db]")
+        sys.exit(1)
+    store = UserStore(sys.argv[2] if len(sys.argv) > 2 else "users.db")
+    for name, (old, new) in store.rebuild_stats().items():
+        mark = "" if old == new else "  <-- расхождение"
+        print(f"{name}: {old} -> {new}{mark}")
+    store.close()
@@ -0,0 +1,75 @@
+import hmac
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from telebot import types
+
+# === ПРИЁМ ОБНОВЛЕНИЙ ЧЕРЕЗ WEBHOOK ===
+# HTTP-поток только проверяет секрет, кладёт обновление в ограниченную очередь
+# исполнителя (lanes.ShardedExecutor) и сразу отвечает 200. Если очередь заполнена,
+# отвечаем 503 — Telegram повторит доставку позже (обратное давление вместо
+# бесконечного роста памяти). При остановке очереди дорабатываются до конца.
+# Порт webhook публичный: /health без metrics отвечает только "ok", а /metrics и
+# состояние полос отдаются лишь при явно переданном metrics.
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    def __init__(self, executor, host="0.0.0.0", port=8080, path="/webhook", secret=None, metrics=None):
+        # metrics — metrics.Registry: на платформах с одним открытым портом /metrics отдаётся здесь же (WEBHOOK_METRICS=1)
+        self.executor = executor
+        self.metrics = metrics
+        self.path = path
+        self.secret = secret
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != server.path:
+                    return self._reply(404)
+                if server.secret and not hmac.compare_digest(
+                        self.headers.get(SECRET_HEADER, ""), server.secret):
+                    return self._reply(403)
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    update = types.Update.de_json(self.rfile.read(length).decode("utf-8"))
+                except Exception as e:
+                    print(f"Некорректное обновление: {e}")
+                    return self._reply(400)
+                if not server.executor.submit(update, block=False):
+                    return self._reply(503)
+                self._reply(200)
+
+            def do_GET(self):
+                if self.path == "/metrics" and server.metrics is not None:
+                    return self._reply(200, server.metrics.render(), "text/plain; version=0.0.4; charset=utf-8")
+                if self.path != "/health":
+                    return self._reply(404)
+                if server.metrics is None:
+                    return self._reply(200, json.dumps({"status": "ok"}))
+                body = json.dumps({"queue": server.executor.depth(), "lanes": server.executor.stats()})
+                self._reply(200, body)
+
+            def _reply(self, code, body="", content_type="application/json"):
+                data = body.encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def serve_forever(self):
+        print(f"Webhook слушает {self.httpd.server_address[0]}:{self.httpd.server_address[1]}{self.path}")
+        self.httpd.serve_forever()
+
+    def close(self):
+        self.httpd.server_close()
@@ -0,0 +1,83 @@
+import threading
+
+# === ОТЛОЖЕННАЯ ЗАПИСЬ (WRITE-BEHIND) ===
+# Общий механизм для буферов, которые пишут в users.db пачками: обработчик только
+# кладёт запись в память, фоновый поток раз в flush_interval секунд (или при
+# накоплении flush_batch записей) сбрасывает всё накопленное одной транзакцией.
+# При max_pending пишет сам вызывающий — жёсткий предел памяти.
+# Наследник задаёт формат буфера (_new_pending/_add/_restore) и запись (_write).
+
+
+class WriteBehindBuffer:
+    thread_name = "write-behind"
+    error_text = "Ошибка отложенной записи"
+
+    def __init__(self, flush_interval, flush_batch, max_pending):
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.max_pending = max_pending
+        self.pending = self._new_pending()
+        self.lock = threading.Lock()
+        # flush_lock не даёт двум сбросам идти параллельно (фоновый поток и flush() из админки)
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    # --- формат буфера (вызывается под self.lock) ---
+    def _new_pending(self):
+        return []
+
+    def _add(self, item):
+        self.pending.append(item)
+
+    def _restore(self, batch):
+        # Возвращаем в начало, чтобы сохранить порядок; сверх предела — теряем старые
+        self.pending = (batch + self.pending)[-self.max_pending:]
+
+    def _write(self, batch):
+        raise NotImplementedError
+
+    # --- общая часть ---
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+            self.thread.start()
+
+    def put(self, item):
+        with self.lock:
+            self._add(item)
+            size = len(self.pending)
+        if size >= self.max_pending:
+            # Фоновый поток не успевает — пишем сами
+            self.flush()
+        elif size >= self.flush_batch:
+            self.wakeup.set()
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                if not self.pending:
+                    return 0
+                batch, self.pending = self.pending, self._new_pending()
+            try:
+                self._write(batch)
+            except Exception as e:
+                print(f"{self.error_text}: {e}")
+                with self.lock:
+                    self._restore(batch)
+                return 0
+            return len(batch)
+
+    def _run(self):
+        while not self.stopped.is_set():
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.flush()
+
+    def stop(self):
+        self.stopped.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+        self.flush()